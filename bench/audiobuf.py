@@ -0,0 +1,92 @@
+"""
+audiobuf.py — PCM buffering helpers shared by the bench tools.
+
+ByteRing is the lock-free single-producer / single-consumer byte ring the
+audio scripts use to hand PCM between a socket thread and a sender or
+playback thread without allocating per packet. wav_data_offset() finds
+the PCM inside an mmap'd WAV file so it can be streamed straight from
+the page cache.
+
+Usage:
+    ring = ByteRing(1 << 20)
+    ring.push(payload)            # producer thread
+    n = ring.pop_into(out)        # consumer thread (or: for view in ring.pop_all())
+
+    pcm = memoryview(mm)[wav_data_offset(mm):]
+"""
+
+import struct
+
+
+class ByteRing:
+    """
+    Single-producer / single-consumer byte ring.
+
+    `head` and `tail` are running byte counts: only the consumer stores
+    `head`, only the producer stores `tail`, and each is published with a
+    single int store after the copy it covers, so neither side takes a
+    lock. `size` must be a power of two. A push that does not fit is
+    dropped whole and counted in `dropped`.
+    """
+
+    def __init__(self, size: int):
+        assert size & (size - 1) == 0, "ring size must be a power of two"
+        self.size = size
+        self.mask = size - 1
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def push(self, data) -> bool:
+        """Producer: copy `data` in (one or two slices around the wrap)."""
+        data = memoryview(data).cast("B")
+        n = len(data)
+        tail = self.tail
+        if n > self.size - (tail - self.head):
+            self.dropped += n
+            return False
+        i = tail & self.mask
+        first = min(n, self.size - i)
+        self.view[i:i + first] = data[:first]
+        if first < n:
+            self.view[:n - first] = data[first:]
+        self.tail = tail + n
+        return True
+
+    def pop_all(self):
+        """Consumer: yield views of everything readable, freeing each once the caller moves on."""
+        while self.head != self.tail:
+            head = self.head
+            i = head & self.mask
+            n = min(self.tail - head, self.size - i)
+            yield self.view[i:i + n]
+            self.head = head + n
+
+    def pop_into(self, dst) -> int:
+        """Consumer: copy up to len(dst) readable bytes into `dst`; return the count."""
+        head = self.head
+        n = min(self.tail - head, len(dst))
+        i = head & self.mask
+        first = min(n, self.size - i)
+        dst[:first] = self.view[i:i + first]
+        if first < n:
+            dst[first:n] = self.view[:n - first]
+        self.head = head + n
+        return n
+
+
+def wav_data_offset(buf) -> int:
+    """Byte offset of the `data` chunk payload in a RIFF/WAVE image."""
+    off = 12  # "RIFF" <size> "WAVE"
+    while off + 8 <= len(buf):
+        chunk_id = bytes(buf[off:off + 4])
+        (chunk_size,) = struct.unpack_from("<I", buf, off + 4)
+        if chunk_id == b"data":
+            return off + 8
+        off += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV has no data chunk")
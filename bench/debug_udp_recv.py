@@ -8,10 +8,17 @@ Run the Rust server with: RUST_LOG=info cargo run -- --openai-realtime
 Usage:
   python3 bench/debug_udp_recv.py          # 5s mic capture (default)
   python3 bench/debug_udp_recv.py 10       # 10s mic capture
+  CPU_SEND=2 CPU_RECV=3 python3 bench/debug_udp_recv.py   # pin threads (Linux)
 """
-import socket, struct, sys, threading, time, wave, os
+import socket, struct, sys, threading, time, os, selectors
+from collections import deque
+
+from audiobuf import ByteRing
+from mmsg import UdpBatchReceiver, set_socket_buffers
+from threadtune import cpu_from_env, pin_to_cpu
 
 ESP_HEADER = 4
+ESP_HDR = struct.Struct("<HBB")  # seq: u16, type: u8, flags: u8
 PKT_AUDIO_UP = 0x01
 PKT_AUDIO_DOWN = 0x02
 PKT_CONTROL = 0x03
@@ -32,60 +39,148 @@ CTRL_NAMES = {
     0x04: "STREAM_END", 0x05: "ACK", 0x06: "CANCEL", 0x07: "SERVER_READY",
 }
 
+_ts_cache = threading.local()  # per-thread (second, "HH:MM:SS") prefix
+
+
 def ts():
-    return time.strftime("%H:%M:%S", time.localtime()) + f".{int(time.time()*1000)%1000:03d}"
+    t = time.time()
+    sec = int(t)
+    if getattr(_ts_cache, "sec", -1) != sec:
+        _ts_cache.sec = sec
+        _ts_cache.prefix = time.strftime("%H:%M:%S", time.localtime(sec))
+    return f"{_ts_cache.prefix}.{int(t * 1000) % 1000:03d}"
 
 def build_pkt(seq, ptype, flags=0, payload=b""):
-    return struct.pack("<HBB", seq & 0xFFFF, ptype, flags) + payload
+    return ESP_HDR.pack(seq & 0xFFFF, ptype, flags) + payload
+
+# 44-byte canonical PCM WAV header: RIFF / fmt / data
+WAV_HDR = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def write_wav(path, chunks, rate=SAMPLE_RATE):
+    """Write 16-bit mono PCM to `path` from an iterable of bytes-like chunks (no copy).
+
+    The header is written with zero sizes and patched once the data length is known.
+    """
+    def header(n):
+        return WAV_HDR.pack(b"RIFF", 36 + n, b"WAVE",
+                            b"fmt ", 16, 1, 1, rate, rate * 2, 2, 16,
+                            b"data", n)
+
+    with open(path, "wb") as fp:
+        fp.write(header(0))
+        n = 0
+        for chunk in chunks:
+            n += fp.write(chunk)
+        fp.seek(0)
+        fp.write(header(n))
+
 
 # ── Globals ────────────────────────────────────────────────────
-recv_audio = bytearray()
+recv_ring = ByteRing(8 << 20)  # AUDIO_DOWN payloads (~260s at 16 kHz)
 recv_pkts = 0
 recv_bytes = 0
 recv_controls = []
 running = True
 stream_end = threading.Event()
+log_q = deque(maxlen=1000)  # receiver log lines, drained by log_writer()
 
 
-def receiver(sock):
-    """Background: receive ALL packets from server."""
-    global recv_pkts, recv_bytes, running
-    sock.settimeout(0.5)
-    while running:
-        try:
-            data, addr = sock.recvfrom(65535)
-        except socket.timeout:
-            continue
-        except Exception as e:
-            print(f"[{ts()}] RECV ERROR: {e}", file=sys.stderr)
-            break
+def log(msg):
+    """Queue a timestamped line for log_writer — keeps stdio off the recv path."""
+    log_q.append(f"[{ts()}] {msg}")
+
 
-        if len(data) < 4:
-            print(f"[{ts()}] ??? tiny packet: {len(data)} bytes")
-            continue
-
-        pt = data[2]
-        payload = data[4:]
-
-        if pt == PKT_AUDIO_DOWN:
-            recv_audio.extend(payload)
-            recv_pkts += 1
-            recv_bytes += len(payload)
-            if recv_pkts <= 5 or recv_pkts % 50 == 0:
-                print(f"[{ts()}] AUDIO_DOWN #{recv_pkts}: {len(payload)}B "
-                      f"(total: {recv_bytes/1024:.1f}KB)")
-        elif pt == PKT_CONTROL:
-            cmd = payload[0] if payload else 0
-            name = CTRL_NAMES.get(cmd, f"0x{cmd:02x}")
-            print(f"[{ts()}] CONTROL: {name}")
-            recv_controls.append(name)
-            if cmd == CTRL_STREAM_END:
-                stream_end.set()
-        elif pt == PKT_HEARTBEAT:
-            seq_r = struct.unpack("<H", data[:2])[0]
-            sock.sendto(build_pkt(seq_r, PKT_HEARTBEAT), addr)
-        else:
-            print(f"[{ts()}] UNKNOWN type=0x{pt:02x} {len(data)}B")
+def log_writer():
+    """Background: flush queued receiver log lines at ~10 Hz."""
+    while True:
+        lines = []
+        while log_q:
+            lines.append(log_q.popleft())
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+        elif not running:
+            break
+        time.sleep(0.1)
+
+
+def receiver(sock, wake_fd, cpu=None):
+    """Background: receive ALL packets from server.
+
+    Blocks in the selector until the socket is readable or main() writes
+    to `wake_fd` to shut us down, then drains the socket without blocking.
+    Counters are kept locally and published to the globals once per drained
+    batch; the CONTROL list is handed over when the thread exits.
+    """
+    global recv_pkts, recv_bytes, recv_controls
+    pin_to_cpu(cpu, "receiver")
+    sock.setblocking(False)
+    rx = UdpBatchReceiver(sock, batch=32, bufsize=2048)
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    sel.register(wake_fd, selectors.EVENT_READ)
+    pkts = nbytes = 0
+    controls = []
+    try:
+        while True:
+            for key, _ in sel.select():
+                if key.fileobj == wake_fd:
+                    return
+            while True:
+                try:
+                    batch = rx.recv()
+                except BlockingIOError:
+                    break
+                except Exception as e:
+                    print(f"[{ts()}] RECV ERROR: {e}", file=sys.stderr)
+                    return
+
+                for data, addr in batch:
+                    n = handle_packet(sock, data, addr, controls)
+                    if n:
+                        pkts += 1
+                        nbytes += n
+                        if pkts <= 5 or pkts % 50 == 0:
+                            log(f"AUDIO_DOWN #{pkts}: {n}B "
+                                f"(total: {nbytes/1024:.1f}KB)")
+                recv_pkts, recv_bytes = pkts, nbytes
+    finally:
+        sel.close()
+        recv_pkts, recv_bytes = pkts, nbytes
+        recv_controls = controls
+
+
+def handle_packet(sock, data, addr, controls):
+    """Dispatch one datagram (a view into the receiver's batch buffer).
+
+    Returns the AUDIO_DOWN payload size buffered, or 0 for anything else.
+    """
+    if len(data) < 4:
+        log(f"??? tiny packet: {len(data)} bytes")
+        return 0
+
+    pt = data[2]
+    payload = data[4:]
+
+    if pt == PKT_AUDIO_DOWN:
+        if not recv_ring.push(payload):
+            log(f"AUDIO_DOWN ring full — dropped {len(payload)}B")
+            return 0
+        return len(payload)
+    elif pt == PKT_CONTROL:
+        cmd = payload[0] if payload else 0
+        name = CTRL_NAMES.get(cmd, f"0x{cmd:02x}")
+        log(f"CONTROL: {name}")
+        controls.append(name)
+        if cmd == CTRL_STREAM_END:
+            stream_end.set()
+    elif pt == PKT_HEARTBEAT:
+        seq_r = struct.unpack("<H", data[:2])[0]
+        sock.sendto(build_pkt(seq_r, PKT_HEARTBEAT), addr)
+    else:
+        log(f"UNKNOWN type=0x{pt:02x} {len(data)}B")
+    return 0
 
 
 def main():
@@ -98,13 +193,19 @@ def main():
         sys.exit(1)
 
     duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    cpu_send = cpu_from_env("CPU_SEND")
+    cpu_recv = cpu_from_env("CPU_RECV")
+    pin_to_cpu(cpu_send, "capture")
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.settimeout(3.0)
+    sndbuf, rcvbuf = set_socket_buffers(sock)
     sock.bind(("0.0.0.0", 0))
     port = sock.getsockname()[1]
 
     print(f"[{ts()}] Bound on port {port}, server={SERVER}")
+    print(f"[{ts()}] Socket buffers: "
+          f"SO_SNDBUF={sndbuf // 1024}KB SO_RCVBUF={rcvbuf // 1024}KB")
     print(f"[{ts()}] Will record {duration:.0f}s from default mic")
     print()
 
@@ -123,37 +224,42 @@ def main():
         return
 
     # ── Start receiver thread ──────────────────────────────────────
-    recv_thread = threading.Thread(target=receiver, args=(sock,), daemon=True)
+    wake_r, wake_w = os.pipe()
+    recv_thread = threading.Thread(target=receiver, args=(sock, wake_r, cpu_recv), daemon=True)
     recv_thread.start()
+    log_thread = threading.Thread(target=log_writer, daemon=True)
+    log_thread.start()
 
     # ── Record + send mic audio ────────────────────────────────────
     print(f"\n[{ts()}] Recording {duration:.0f}s — SPEAK NOW!")
-    sent_pcm = bytearray()
-    seq = 1
     total_chunks = int(duration * SAMPLE_RATE / CHUNK_SAMPLES)
+    # One packet buffer reused for every chunk: header packed in place,
+    # raw mic bytes copied straight into the payload region.
+    pkt_buf = bytearray(ESP_HEADER + CHUNK_SAMPLES * 2)
+    pkt_pcm = memoryview(pkt_buf)[ESP_HEADER:]
     t0 = time.monotonic()
 
-    with sd.InputStream(samplerate=SAMPLE_RATE, blocksize=CHUNK_SAMPLES,
-                        channels=1, dtype="int16") as stream:
-        for i in range(total_chunks):
-            frames, _ = stream.read(CHUNK_SAMPLES)
-            pcm = frames.tobytes()
-            sent_pcm.extend(pcm)
-            pkt = build_pkt(seq, PKT_AUDIO_UP, 0, pcm)
-            sock.sendto(pkt, SERVER)
-            seq += 1
-
-            if (i + 1) % 23 == 0:  # ~1s
-                elapsed = time.monotonic() - t0
-                print(f"[{ts()}] UP: {seq-1} pkts ({len(sent_pcm)/1024:.0f}KB)  "
+    with sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=CHUNK_SAMPLES,
+                           channels=1, dtype="int16") as stream:
+        for seq in range(1, total_chunks + 1):
+            data, _ = stream.read(CHUNK_SAMPLES)
+            ESP_HDR.pack_into(pkt_buf, 0, seq & 0xFFFF, PKT_AUDIO_UP, 0)
+            pkt_pcm[:] = data
+            sock.sendto(pkt_buf, SERVER)
+
+            if seq % 23 == 0:  # ~1s
+                sent_bytes = seq * len(pkt_pcm)
+                print(f"[{ts()}] UP: {seq} pkts ({sent_bytes/1024:.0f}KB)  "
                       f"DOWN: {recv_bytes/1024:.1f}KB ({recv_pkts} pkts)")
 
     dt = time.monotonic() - t0
-    print(f"\n[{ts()}] Mic done — {seq-1} pkts, {len(sent_pcm)/1024:.0f}KB in {dt:.1f}s")
+    sent_pkts = total_chunks
+    sent_bytes = sent_pkts * len(pkt_pcm)
+    print(f"\n[{ts()}] Mic done — {sent_pkts} pkts, {sent_bytes/1024:.0f}KB in {dt:.1f}s")
 
     # ── SESSION_END ────────────────────────────────────────────────
     print(f"[{ts()}] --> SESSION_END")
-    sock.sendto(build_pkt(seq, PKT_CONTROL, 0, bytes([CTRL_SESSION_END])), SERVER)
+    sock.sendto(build_pkt(sent_pkts + 1, PKT_CONTROL, 0, bytes([CTRL_SESSION_END])), SERVER)
     # Don't block waiting for ACK — the receiver thread will log it
 
     # ── Wait for response ──────────────────────────────────────────
@@ -179,24 +285,24 @@ def main():
         time.sleep(0.2)
 
     running = False
+    os.write(wake_w, b"x")
     recv_thread.join(timeout=2)
+    log_thread.join(timeout=1)
 
     # ── Results ────────────────────────────────────────────────────
     print()
     print("=" * 60)
-    print(f"  SENT:     {len(sent_pcm)/1024:.0f} KB ({seq-1} pkts, {len(sent_pcm)/32000:.1f}s)")
+    print(f"  SENT:     {sent_bytes/1024:.0f} KB ({sent_pkts} pkts, {sent_bytes/32000:.1f}s)")
     print(f"  RECEIVED: {recv_bytes/1024:.1f} KB ({recv_pkts} pkts, {recv_bytes/32000:.1f}s)")
     print(f"  CONTROLS: {recv_controls}")
+    if recv_ring.dropped:
+        print(f"  DROPPED:  {recv_ring.dropped/1024:.1f} KB (ring full)")
     print("=" * 60)
 
-    if recv_audio:
+    if recv_bytes:
         os.makedirs("esp_audio", exist_ok=True)
         path = "esp_audio/debug_response.wav"
-        with wave.open(path, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(SAMPLE_RATE)
-            wf.writeframes(bytes(recv_audio))
+        write_wav(path, recv_ring.pop_all())
         print(f"\n  Response saved: {path}")
         print(f"  Play: afplay {path}")
     else:
@@ -1,23 +1,22 @@
 #!/usr/bin/env python3
 """Generate test WAV files for testing without a microphone."""
-import wave, struct, math
+import wave
+
+import numpy as np
 
 rate = 16000
 
 # 5s speech-like WAV: varying frequency with silence gaps
-samples = []
-for t in range(rate * 5):
-    f = 200 + 300 * math.sin(2 * math.pi * 2 * t / rate)
-    s = int(8000 * math.sin(2 * math.pi * f * t / rate))
-    sec = t / rate
-    if 1.0 < sec < 1.5 or 3.0 < sec < 3.5:
-        s = 0
-    samples.append(s)
+t = np.arange(rate * 5, dtype=np.float64)
+f = 200 + 300 * np.sin(2 * np.pi * 2 * t / rate)
+samples = (8000 * np.sin(2 * np.pi * f * t / rate)).astype(np.int16)
+sec = t / rate
+samples[((sec > 1.0) & (sec < 1.5)) | ((sec > 3.0) & (sec < 3.5))] = 0
 
 with wave.open("bench/test_speech_like.wav", "w") as w:
     w.setnchannels(1)
     w.setsampwidth(2)
     w.setframerate(rate)
-    w.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+    w.writeframes(samples.astype("<i2").tobytes())
 
 print(f"Created bench/test_speech_like.wav ({len(samples)/rate:.1f}s, {rate} Hz)")
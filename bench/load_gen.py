@@ -11,56 +11,364 @@ Usage:
 """
 
 import argparse
+import array
 import socket
 import struct
+import sys
 import time
 import os
 import json
+import select
+
+from mmsg import UdpBatchSender, set_socket_buffers, tune_udp_socket
+from threadtune import check_args, pin_to_cpu, set_rt_priority
 
 HEADER_FORMAT = "<IQBxxxHxxQ4x"  # matches sensor_header_t (32 bytes)
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER = struct.Struct(HEADER_FORMAT)
+HEADER_SIZE = HEADER.size
+LEN_PREFIX = struct.Struct("<I")  # TCP framing: [u32 LE total_len][packet_data]
+
+# MSG_ZEROCOPY (Linux ≥ 4.14) — not exported by the socket module
+SO_ZEROCOPY = 60
+MSG_ZEROCOPY = 0x4000000
+IP_RECVERR = 11
+SO_EE_ORIGIN_ZEROCOPY = 5
+SOCK_EXTENDED_ERR = struct.Struct("=IBBBBII")  # errno, origin, type, code, pad, info, data
+
+URING_DEPTH_BATCHES = 4  # --iouring packet slots, in batches (lets bursts overlap)
 
 
-def make_packet(sensor_id: int, seq: int, payload: bytes) -> bytes:
-    """Build a binary sensor packet matching the wire format."""
-    timestamp_us = int(time.time() * 1_000_000)
-    header = struct.pack(
-        HEADER_FORMAT,
+def make_packet(buf, sensor_id: int, seq: int, timestamp_us: int):
+    """Fill the header of a packet buffer in place, matching the wire format."""
+    HEADER.pack_into(
+        buf, 0,
         sensor_id,
         timestamp_us,
         1,  # data_type
-        len(payload),
+        len(buf) - HEADER_SIZE,
         seq,
     )
-    return header + payload
+    return buf
+
+
+# Header fields as 32-bit word indexes (sensor_header_t is 4-byte aligned)
+_W_SENSOR_ID = 0    # u32 @ 0
+_W_TIMESTAMP = 1    # u64 @ 4  (lo, hi)
+_W_SEQ = 5          # u64 @ 20 (lo, hi)
+_FAST_FILL = sys.byteorder == "little" and array.array("I").itemsize == 4
+
+
+class PacketBatch:
+    """
+    `n` reusable packet buffers carved out of one contiguous bytearray.
+
+    Packets sit at a 4-byte-aligned stride, so each per-packet header field
+    is a strided 32-bit column of the backing buffer. fill() then writes a
+    whole burst with one C-level memoryview copy per column instead of one
+    pack_into() per packet. `bufs` are the exact-length packet views handed
+    to the senders.
+    """
+
+    def __init__(self, payload: bytes, n: int, sensors: int):
+        pkt_len = HEADER_SIZE + len(payload)
+        stride = (pkt_len + 3) & ~3
+        self.size = n
+        self.sensors = sensors
+        self.buf = bytearray(stride * n)
+        mv = memoryview(self.buf)
+        self.bufs = [mv[i * stride:i * stride + pkt_len] for i in range(n)]
+        for pkt in self.bufs:
+            make_packet(pkt, 0, 0, 0)  # constant fields: data_type, len
+            pkt[HEADER_SIZE:] = payload
+
+        w = stride // 4
+        words = mv.cast("I")
+        self._sensor_col = words[_W_SENSOR_ID::w]
+        self._ts_lo_col = words[_W_TIMESTAMP::w]
+        self._ts_hi_col = words[_W_TIMESTAMP + 1::w]
+        self._seq_lo_col = words[_W_SEQ::w]
+        self._seq_hi_col = words[_W_SEQ + 1::w]
+        # sensor_id = seq % sensors repeats with period `sensors`: any n
+        # consecutive ids are one slice of this precomputed cycle.
+        self._sensor_cycle = memoryview(array.array("I", [i % sensors for i in range(sensors + n)]))
+
+    def fill(self, n: int, seq: int, timestamp_us: int):
+        """Write headers for packets seq … seq+n-1 into bufs[:n]; returns their sensor ids."""
+        off = seq % self.sensors
+        sensor_ids = self._sensor_cycle[off:off + n]
+        lo = seq & 0xFFFFFFFF
+        if not _FAST_FILL or lo + n > 1 << 32:
+            # big-endian host, or the low seq word wraps inside this burst
+            for i in range(n):
+                make_packet(self.bufs[i], sensor_ids[i], seq + i, timestamp_us)
+            return sensor_ids
+
+        self._sensor_col[:n] = sensor_ids
+        self._seq_lo_col[:n] = array.array("I", range(lo, lo + n))
+        self._seq_hi_col[:n] = array.array("I", [seq >> 32]) * n
+        self._ts_lo_col[:n] = array.array("I", [timestamp_us & 0xFFFFFFFF]) * n
+        self._ts_hi_col[:n] = array.array("I", [timestamp_us >> 32]) * n
+        return sensor_ids
+
+
+def tune_socket_buffers(sock, udp=False):
+    """Request large kernel socket buffers (and DF for UDP); log what the kernel granted."""
+    sndbuf, rcvbuf = tune_udp_socket(sock) if udp else set_socket_buffers(sock)
+    print(f"   socket buffers: SO_SNDBUF={sndbuf // 1024} KB, SO_RCVBUF={rcvbuf // 1024} KB")
+
+
+def sendmsg_all(sock, parts, flags=0):
+    """sendmsg() a scatter-gather list, finishing any partial write with sendall()."""
+    sent = sock.sendmsg(parts, [], flags)
+    for part in parts:
+        if sent >= len(part):
+            sent -= len(part)
+            continue
+        sock.sendall(memoryview(part)[sent:])
+        sent = 0
+
+
+def reap_zerocopy(sock, poller, timeout_ms=1000):
+    """Drain MSG_ZEROCOPY completions from the error queue.
+
+    Returns one past the highest completed send id seen (0 if none), after
+    waiting up to `timeout_ms` for the queue to become readable.
+    """
+    done = 0
+    poller.poll(timeout_ms)
+    while True:
+        try:
+            _, ancdata, _, _ = sock.recvmsg(0, 256, socket.MSG_ERRQUEUE | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return done
+        for level, ctype, data in ancdata:
+            if level not in (socket.IPPROTO_IP, socket.IPPROTO_IPV6) or ctype != IP_RECVERR:
+                continue
+            _, origin, _, _, _, _, hi = SOCK_EXTENDED_ERR.unpack_from(data)
+            if origin == SO_EE_ORIGIN_ZEROCOPY:
+                done = max(done, hi + 1)
 
 
 def run_udp(args, payload):
-    """Send sensor packets via UDP."""
+    """Send sensor packets via UDP, batched with sendmmsg where available."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    target = (args.host, args.port)
+    tune_socket_buffers(sock, udp=True)  # DF: a --payload-size over the path MTU fails loudly
+    sock.connect((args.host, args.port))  # resolve the destination once
+
+    if args.iouring:
+        return run_udp_iouring(args, sock, payload)
+
+    batch = PacketBatch(payload, max(args.batch, 1), args.sensors)
+    bufs = batch.bufs
+    sender = UdpBatchSender(sock, None, bufs)
 
     print(f"🚀 [UDP] Sending {args.rate} pps to {args.host}:{args.port} "
-          f"for {args.duration}s ({args.sensors} sensors, {args.payload_size}B payload)")
+          f"for {args.duration}s ({args.sensors} sensors, {args.payload_size}B payload, "
+          f"batch={len(bufs)})")
+
+    return send_loop(args, lambda n, _sensor_ids: sender.send(n), batch)
+
+
+class UringPacketPool:
+    """
+    --iouring packet slots: `depth` stable bytearrays, sent in place with
+    IORING_OP_SEND. With `zerocopy` they are also registered with the ring
+    as fixed buffers and sent with IORING_OP_SEND_ZC by buffer index; the
+    extra notification CQE per send only pays off for large packets.
+
+    Bursts take consecutive slots round-robin. A slot is busy from
+    submission until its last CQE (for zero-copy, the notification that the
+    kernel let go of the buffer); completions are only reaped when the next
+    burst needs a slot that is still busy, so the kernel works through one
+    burst while the next is being built. Same fill(n, seq, ts) interface as
+    PacketBatch, so send_loop drives it unchanged.
+    """
+
+    def __init__(self, liburing, ring, payload: bytes, size: int, depth: int, sensors: int,
+                 zerocopy: bool = False):
+        self.lu = liburing
+        self.ring = ring
+        self.size = size
+        self.depth = depth
+        self.sensors = sensors
+        self.bufs = [bytearray(HEADER_SIZE + len(payload)) for _ in range(depth)]
+        for buf in self.bufs:
+            buf[HEADER_SIZE:] = payload
+        self.busy = [False] * depth
+        self._all_busy = [True] * size
+        self.head = 0
+        self.cqe = liburing.Cqe()
+        # The CQ is twice the (power-of-two rounded) SQ; track its head
+        # ourselves, since cqe[i] indexes it linearly without wrapping.
+        self.cq_size = 2 << (depth - 1).bit_length()
+        self.cq_head = 0
+        self._sensor_cycle = [i % sensors for i in range(sensors + size)]
+
+        self.zerocopy = zerocopy
+        if zerocopy:
+            probe = liburing.io_uring_get_probe_ring(ring)
+            try:
+                self.zerocopy = liburing.io_uring_opcode_supported(
+                    probe, liburing.io_uring_op.IORING_OP_SEND_ZC)
+            finally:
+                liburing.io_uring_free_probe(probe)
+            if not self.zerocopy:
+                print("⚠️  IORING_OP_SEND_ZC not supported (Linux ≥ 6.0) — using plain sends")
+        if self.zerocopy:
+            self._iov = liburing.Iovec(self.bufs)  # must outlive the registration
+            liburing.io_uring_register_buffers(ring, self._iov)
+
+    def _reap(self):
+        """Wait for at least one CQE, then free the slots of every ready one."""
+        lu = self.lu
+        lu.io_uring_wait_cqe(self.ring, self.cqe)
+        ready = lu.io_uring_cq_ready(self.ring)
+        ready = min(ready, self.cq_size - (self.cq_head & (self.cq_size - 1)))  # up to the wrap
+        try:
+            for i in range(ready):
+                c = self.cqe[i]
+                if not c.flags & lu.IORING_CQE_F_MORE:
+                    self.busy[c.user_data] = False  # last CQE for this slot
+                try:
+                    c.res  # raises OSError for a failed send
+                except ConnectionRefusedError:
+                    pass  # queued ICMP port-unreachable; ignored as with sendto()
+        finally:
+            lu.io_uring_cq_advance(self.ring, ready)
+            self.cq_head += ready
+
+    def fill(self, n: int, seq: int, timestamp_us: int):
+        """Claim the next `n` free slots and write packets seq … seq+n-1 into them."""
+        head = self.head
+        if head + n > self.depth:
+            head = self.head = 0
+        while any(self.busy[head:head + n]):
+            self._reap()
+        bufs = self.bufs
+        off = seq % self.sensors
+        sensor_ids = self._sensor_cycle[off:off + n]
+        for i in range(n):
+            make_packet(bufs[head + i], sensor_ids[i], seq + i, timestamp_us)
+        return sensor_ids
+
+    def send(self, n: int, _sensor_ids=None):
+        """Queue the `n` slots claimed by the last fill() and submit them."""
+        lu = self.lu
+        ring = self.ring
+        head = self.head
+        for slot in range(head, head + n):
+            sqe = lu.io_uring_get_sqe(ring)
+            if sqe is None:  # SQ full — flush and retry
+                lu.io_uring_submit(ring)
+                sqe = lu.io_uring_get_sqe(ring)
+            if self.zerocopy:
+                lu.io_uring_prep_send_zc_fixed(sqe, 0, self.bufs[slot], slot)  # 0 = registered fd
+            else:
+                lu.io_uring_prep_send(sqe, 0, self.bufs[slot])
+            sqe.flags = lu.IOSQE_FIXED_FILE
+            sqe.user_data = slot
+        self.busy[head:head + n] = self._all_busy[:n]
+        self.head = head + n
+        lu.io_uring_submit(ring)  # no syscall when the SQPOLL thread is awake
+
+    def drain(self):
+        """Wait until the kernel has released every slot."""
+        while any(self.busy):
+            self._reap()
+
+
+def run_udp_iouring(args, sock, payload):
+    """Send the UDP batches through io_uring (SQPOLL + registered fd and buffers).
+
+    With SQPOLL the kernel's poll thread picks up submissions, so a burst
+    normally costs no syscall at all; see UringPacketPool for how slots
+    are recycled.
+    """
+    try:
+        import liburing
+    except ImportError:
+        print("❌ liburing not installed. Run: pip3 install liburing")
+        return
+
+    size = max(args.batch, 1)
+    depth = URING_DEPTH_BATCHES * size
+    ring = liburing.Ring()
+    mode = "SQPOLL"
+    try:
+        liburing.io_uring_queue_init(depth, ring, liburing.IORING_SETUP_SQPOLL)
+    except OSError as e:
+        # SQPOLL needs CAP_SYS_NICE before Linux 5.11
+        print(f"⚠️  SQPOLL unavailable ({e}) — using a plain ring")
+        liburing.io_uring_queue_init(depth, ring, 0)
+        mode = "plain"
+
+    try:
+        files = liburing.FileIndex([sock.fileno()])  # must outlive the ring
+        liburing.io_uring_register_files(ring, files)
+        pool = UringPacketPool(liburing, ring, payload, size, depth, args.sensors,
+                               zerocopy=args.zerocopy)
+        if pool.zerocopy:
+            mode += ", fixed buffers, zerocopy"
 
-    return send_loop(args, lambda pkt: sock.sendto(pkt, target), payload)
+        print(f"🚀 [UDP/io_uring] Sending {args.rate} pps to {args.host}:{args.port} "
+              f"for {args.duration}s ({args.sensors} sensors, {args.payload_size}B payload, "
+              f"batch={size}, {depth} slots, {mode})")
+
+        try:
+            return send_loop(args, pool.send, pool)
+        finally:
+            pool.drain()
+    finally:
+        liburing.io_uring_queue_exit(ring)
 
 
 def run_tcp(args, payload):
     """Send sensor packets via TCP with length-prefix framing."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):  # Linux only
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    tune_socket_buffers(sock)
+    zerocopy = args.zerocopy
+    if zerocopy:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_ZEROCOPY, 1)
+        except OSError as e:
+            print(f"⚠️  SO_ZEROCOPY unavailable ({e}) — falling back to copying sends")
+            zerocopy = False
     sock.connect((args.host, args.port))
+    batch = PacketBatch(payload, max(args.batch, 1), args.sensors)
+    bufs = batch.bufs
+    len_prefix = LEN_PREFIX.pack(HEADER_SIZE + len(payload))  # constant: fixed payload
 
     print(f"🚀 [TCP] Sending {args.rate} pps to {args.host}:{args.port} "
-          f"for {args.duration}s ({args.sensors} sensors, {args.payload_size}B payload)")
-
-    def send_tcp(pkt):
-        # Length-prefix: [u32 LE total_len][packet_data]
-        frame = struct.pack("<I", len(pkt)) + pkt
-        sock.sendall(frame)
-
-    result = send_loop(args, send_tcp, payload)
+          f"for {args.duration}s ({args.sensors} sensors, {args.payload_size}B payload, "
+          f"batch={len(bufs)}{', zerocopy' if zerocopy else ''})")
+
+    poller = select.poll()
+    poller.register(sock, 0)  # POLLERR is always reported
+    zc_issued = 0
+    zc_done = 0
+
+    def send_tcp(n, _sensor_ids):
+        nonlocal zc_issued, zc_done
+        # One sendmsg() per batch: [prefix, pkt0, prefix, pkt1, …] as an iovec
+        # list, so frames are never concatenated in Python.
+        parts = []
+        for pkt in bufs[:n]:
+            parts.append(len_prefix)
+            parts.append(pkt)
+        if not zerocopy:
+            sendmsg_all(sock, parts)
+            return
+        sendmsg_all(sock, parts, MSG_ZEROCOPY)
+        zc_issued += 1
+        # The kernel reads `bufs` in place until it reports completion, and the
+        # next burst rewrites them, so wait for this send to be released.
+        while zc_done < zc_issued:
+            zc_done = max(zc_done, reap_zerocopy(sock, poller))
+
+    result = send_loop(args, send_tcp, batch)
     sock.close()
     return result
 
@@ -78,55 +386,81 @@ def run_mqtt(args, payload):
     client.loop_start()
     time.sleep(0.5)  # wait for connection
 
-    topic_prefix = args.mqtt_topic_prefix
+    topics = [f"{args.mqtt_topic_prefix}/{i}" for i in range(args.sensors)]
+    batch = PacketBatch(payload, 1, args.sensors)
+    bufs = batch.bufs
 
     print(f"🚀 [MQTT] Sending {args.rate} pps to {args.mqtt_host}:{args.mqtt_port} "
           f"for {args.duration}s ({args.sensors} sensors, {args.payload_size}B payload)")
 
-    def send_mqtt(pkt):
-        sensor_id = struct.unpack_from("<I", pkt, 0)[0]
-        topic = f"{topic_prefix}/{sensor_id}"
-        client.publish(topic, pkt, qos=0)
+    def send_mqtt(n, sensor_ids):
+        for i in range(n):
+            # paho queues the payload, so hand it a snapshot of the reused buffer
+            client.publish(topics[sensor_ids[i]], bytes(bufs[i]), qos=0)
 
-    result = send_loop(args, send_mqtt, payload)
+    result = send_loop(args, send_mqtt, batch)
     client.loop_stop()
     client.disconnect()
     return result
 
 
-def send_loop(args, send_fn, payload):
-    """Common send loop with rate limiting and progress reporting."""
+def send_loop(args, send_fn, batch):
+    """Common send loop with rate limiting and progress reporting.
+
+    Packets are built in place into `batch.bufs`; `send_fn(n, sensor_ids)`
+    transmits the first `n` of them (`sensor_ids[i]` belongs to `bufs[i]`).
+    Pacing is done in ~1 ms ticks: each wake-up sends a burst of rate/1000
+    packets, then sleeps until the next tick. Deadlines are integer
+    nanoseconds computed from the start time, so they don't drift.
+    """
+    NS = 1_000_000_000
+    clock = time.perf_counter_ns
     seq = 0
     sent = 0
-    start = time.monotonic()
-    interval = 1.0 / args.rate if args.rate > 0 else 0
-    next_send = start
+    ticks = 0
+    start = clock()
+    duration_ns = int(args.duration * NS)
+    if args.rate > 0:
+        burst = max(1, args.rate // 1000)
+    else:
+        burst = batch.size  # unlimited: one full batch per wake-up
+    next_wake = start
+    next_report = start + NS
 
     try:
         while True:
-            now = time.monotonic()
+            now = clock()
             elapsed = now - start
-            if elapsed >= args.duration:
+            if elapsed >= duration_ns:
                 break
 
-            if args.rate > 0 and now < next_send:
-                continue  # busy wait for timing precision
-
-            sensor_id = seq % args.sensors
-            pkt = make_packet(sensor_id, seq, payload)
-            send_fn(pkt)
-            seq += 1
-            sent += 1
-            next_send += interval
-
-            if sent % max(args.rate, 1) == 0:
-                rate_actual = sent / elapsed if elapsed > 0 else 0
-                print(f"  [{elapsed:.1f}s] sent={sent}, rate={rate_actual:.0f} pps")
+            if now < next_wake:
+                time.sleep((next_wake - now) / NS)
+                continue
+
+            timestamp_us = int(time.time() * 1_000_000)  # one clock read per burst
+            remaining = burst
+            while remaining:
+                n = min(remaining, batch.size)
+                sensor_ids = batch.fill(n, seq, timestamp_us)
+                seq += n
+                send_fn(n, sensor_ids)
+                remaining -= n
+            sent += burst
+            ticks += 1
+            if args.rate > 0:
+                # exact integer schedule: tick k is due at start + k·burst/rate
+                next_wake = start + ticks * burst * NS // args.rate
+
+            if now >= next_report:
+                rate_actual = sent * NS / elapsed if elapsed > 0 else 0
+                print(f"  [{elapsed / NS:.1f}s] sent={sent}, rate={rate_actual:.0f} pps")
+                next_report += NS
 
     except KeyboardInterrupt:
         pass
 
-    elapsed = time.monotonic() - start
+    elapsed = (clock() - start) / NS
     print(f"\n📊 Done: {sent} packets in {elapsed:.2f}s "
           f"({sent / elapsed:.0f} pps actual)")
     return sent
@@ -150,9 +484,26 @@ def main():
                         help="Number of simulated sensors")
     parser.add_argument("--payload-size", type=int, default=64,
                         help="Payload size in bytes")
+    parser.add_argument("--batch", type=int, default=64,
+                        help="Packets per sendmmsg()/sendmsg() call (default: 64)")
+    parser.add_argument("--iouring", action="store_true",
+                        help="UDP only: submit batches through io_uring "
+                             "(Linux; pip3 install liburing)")
+    parser.add_argument("--zerocopy", action="store_true",
+                        help="TCP: send with MSG_ZEROCOPY; UDP with --iouring: SEND_ZC "
+                             "from registered fixed buffers (Linux; pays off with "
+                             "large --payload-size x --batch)")
+    parser.add_argument("--cpu-send", type=int, default=None,
+                        help="Pin the send loop to this CPU core (Linux only)")
+    parser.add_argument("--rt-prio", type=int, default=None,
+                        help="Run the send loop SCHED_FIFO at this priority, 1-99 "
+                             "(Linux; needs root or CAP_SYS_NICE)")
     args = parser.parse_args()
+    check_args(parser, args.cpu_send, args.rt_prio, cpu_flag="--cpu-send")
 
     payload = os.urandom(args.payload_size)
+    pin_to_cpu(args.cpu_send)
+    set_rt_priority(args.rt_prio)
 
     if args.transport == "udp":
         run_udp(args, payload)
@@ -0,0 +1,365 @@
+"""
+mmsg.py — batched UDP I/O via Linux sendmmsg(2)/recvmmsg(2), bound through ctypes.
+
+The socket module only exposes one datagram per syscall, which caps the
+bench tools long before the bridge does. UdpBatchSender hands a whole batch
+of preallocated packet buffers to the kernel in a single sendmmsg() call;
+UdpGatherSender does the same for header + payload-slice datagrams without
+copying the payload; UdpBatchReceiver drains up to a batch of queued
+datagrams per recvmmsg().
+On platforms without these syscalls (macOS, Windows) all three fall back to
+sendto()/recvfrom().
+
+Usage:
+    bufs = [bytearray(96) for _ in range(64)]
+    sender = UdpBatchSender(sock, ("127.0.0.1", 9000), bufs)
+    # … fill bufs[0:n] in place …
+    sender.send(n)
+
+    receiver = UdpBatchReceiver(sock)
+    for data, addr in receiver.recv():
+        ...
+
+tune_udp_socket() applies the socket setup the bench senders share: large
+kernel buffers and, on Linux, DF.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import sys
+
+# ── libc binding ────────────────────────────────────────────────────
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _sendmmsg = _libc.sendmmsg
+    _recvmmsg = _libc.recvmmsg
+except (OSError, AttributeError):
+    _sendmmsg = None
+    _recvmmsg = None
+
+HAVE_SENDMMSG = _sendmmsg is not None
+HAVE_RECVMMSG = _recvmmsg is not None
+
+MSG_DONTWAIT = 0x40  # Linux value; not exported by the socket module
+IP_MTU_DISCOVER = 10  # Linux values; not exported by the socket module either
+IP_PMTUDISC_DO = 2
+
+SOCKET_BUF_BYTES = 8 << 20  # the kernel caps this at net.core.{w,r}mem_max
+
+
+def set_socket_buffers(sock: socket.socket, size: int = SOCKET_BUF_BYTES):
+    """Request `size`-byte kernel send/receive buffers; return the (SO_SNDBUF, SO_RCVBUF) granted."""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    return (sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+
+
+def tune_udp_socket(sock: socket.socket, size: int = SOCKET_BUF_BYTES):
+    """set_socket_buffers(), plus DF on Linux so an oversized datagram fails
+    loudly (EMSGSIZE) instead of being fragmented. Returns the granted sizes.
+    """
+    granted = set_socket_buffers(sock, size)
+    if sys.platform.startswith("linux"):
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    return granted
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),   # network byte order
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+
+if HAVE_SENDMMSG:
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+
+if HAVE_RECVMMSG:
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                          ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+
+
+def _sendmmsg_all(sock, msgs_addr, n):
+    """Push msgs[0:n] through sendmmsg(), resuming after partial sends.
+
+    The raw syscall bypasses the socket module's timeout handling, and a
+    socket with a timeout (or shared with a selector-driven receiver) is
+    O_NONBLOCK. So a full send buffer (EAGAIN) waits for writability —
+    up to the socket's timeout, or indefinitely if it has none or is
+    non-blocking — instead of dropping the rest of the batch.
+    """
+    fd = sock.fileno()
+    done = 0
+    while done < n:
+        ret = _sendmmsg(fd, msgs_addr + done * ctypes.sizeof(_MMsgHdr), n - done, 0)
+        if ret < 0:
+            err = ctypes.get_errno()
+            if err == errno.ECONNREFUSED:
+                continue  # error is cleared by reporting it; retry the batch
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                _, writable, _ = select.select([], [fd], [], sock.gettimeout() or None)
+                if not writable:
+                    raise socket.timeout("timed out")
+                continue
+            raise OSError(err, os.strerror(err))
+        done += ret
+    return done
+
+
+def _sockaddr_in(addr):
+    host, port = addr
+    name = _SockAddrIn()
+    name.sin_family = socket.AF_INET
+    name.sin_port = socket.htons(port)
+    name.sin_addr[:] = socket.inet_aton(socket.gethostbyname(host))
+    return name
+
+
+# ── Batch sender ────────────────────────────────────────────────────
+
+class UdpBatchSender:
+    """
+    Sends the first `n` of a fixed set of packet buffers in one syscall.
+
+    The buffers are pinned for the lifetime of the sender (the iovecs point
+    straight into them), so fill them in place rather than replacing them.
+    Pass `addr=None` for a connected socket. ECONNREFUSED (a queued ICMP
+    port-unreachable on a connected socket) is ignored, as it would be for
+    sendto() on an unconnected one. A full send buffer blocks send() until
+    the whole batch is queued, even on a non-blocking socket.
+    """
+
+    def __init__(self, sock: socket.socket, addr, buffers):
+        self.sock = sock
+        self.addr = addr
+        self.buffers = buffers
+        self.fd = sock.fileno()
+
+        if not HAVE_SENDMMSG:
+            return
+
+        n = len(buffers)
+        self._views = [(ctypes.c_char * len(b)).from_buffer(b) for b in buffers]
+        self._iov = (_IoVec * n)()
+        self._msgs = (_MMsgHdr * n)()
+        self._msgs_addr = ctypes.addressof(self._msgs)
+
+        self._truncated = False
+        self._name = _sockaddr_in(addr) if addr is not None else None
+
+        for i, view in enumerate(self._views):
+            self._iov[i].iov_base = ctypes.addressof(view)
+            self._iov[i].iov_len = len(view)
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+            if self._name is not None:
+                hdr.msg_name = ctypes.addressof(self._name)
+                hdr.msg_namelen = ctypes.sizeof(self._name)
+
+    def send(self, n: int, lengths=None, start: int = 0) -> int:
+        """Send buffers[start:start + n] (optionally truncated to `lengths[i]` bytes)."""
+        if HAVE_SENDMMSG:
+            if lengths is not None:
+                for i in range(n):
+                    self._iov[start + i].iov_len = lengths[i]
+                self._truncated = True
+            elif self._truncated:
+                for i, view in enumerate(self._views):
+                    self._iov[i].iov_len = len(view)
+                self._truncated = False
+
+        if not HAVE_SENDMMSG:
+            for i in range(n):
+                buf = self.buffers[start + i]
+                pkt = memoryview(buf)[:lengths[i]] if lengths is not None else buf
+                try:
+                    if self.addr is None:
+                        self.sock.send(pkt)
+                    else:
+                        self.sock.sendto(pkt, self.addr)
+                except ConnectionRefusedError:
+                    pass
+            return n
+
+        return _sendmmsg_all(self.sock, self._msgs_addr + start * ctypes.sizeof(_MMsgHdr), n)
+
+
+# ── Gather sender ───────────────────────────────────────────────────
+
+class UdpGatherSender:
+    """
+    Sends `headers[i] + payload[offsets[i]:offsets[i] + size]` datagrams.
+
+    Each message carries two iovecs, so the payload bytes go from
+    `payload` (any writable buffer — bytearray, int16 ndarray, …) to the
+    kernel without being copied into a packet buffer first. Headers are
+    patched in place like UdpBatchSender's buffers; `payload` is pinned for
+    the lifetime of the sender. ECONNREFUSED is ignored the same way.
+    """
+
+    def __init__(self, sock: socket.socket, addr, headers, payload, size: int):
+        self.sock = sock
+        self.addr = addr
+        self.headers = headers
+        self.payload = memoryview(payload).cast("B")
+        self.size = size
+        self.fd = sock.fileno()
+
+        if not HAVE_SENDMMSG:
+            return
+
+        n = len(headers)
+        self._hviews = [(ctypes.c_char * len(h)).from_buffer(h) for h in headers]
+        self._pview = (ctypes.c_char * self.payload.nbytes).from_buffer(self.payload)
+        self._base = ctypes.addressof(self._pview)
+        self._iov = (_IoVec * (2 * n))()
+        self._msgs = (_MMsgHdr * n)()
+        self._msgs_addr = ctypes.addressof(self._msgs)
+        self._name = _sockaddr_in(addr) if addr is not None else None
+
+        for i, view in enumerate(self._hviews):
+            self._iov[2 * i].iov_base = ctypes.addressof(view)
+            self._iov[2 * i].iov_len = len(view)
+            self._iov[2 * i + 1].iov_len = size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._iov[2 * i])
+            hdr.msg_iovlen = 2
+            if self._name is not None:
+                hdr.msg_name = ctypes.addressof(self._name)
+                hdr.msg_namelen = ctypes.sizeof(self._name)
+
+    def send(self, n: int, offsets) -> int:
+        """Send n datagrams: headers[i] followed by `size` payload bytes at offsets[i]."""
+        if not HAVE_SENDMMSG:
+            for i in range(n):
+                parts = [self.headers[i], self.payload[offsets[i]:offsets[i] + self.size]]
+                try:
+                    if self.addr is None:
+                        self.sock.sendmsg(parts)
+                    else:
+                        self.sock.sendmsg(parts, [], 0, self.addr)
+                except ConnectionRefusedError:
+                    pass
+            return n
+
+        for i in range(n):
+            self._iov[2 * i + 1].iov_base = self._base + offsets[i]
+        return _sendmmsg_all(self.sock, self._msgs_addr, n)
+
+    def close(self):
+        """Drop the sender's exports of `payload`, so e.g. an mmap behind it can close."""
+        self._pview = None
+        self.payload.release()
+
+
+# ── Batch receiver ──────────────────────────────────────────────────
+
+class UdpBatchReceiver:
+    """
+    Drains up to `batch` queued datagrams per recvmmsg() call.
+
+    recv() waits for the socket to become readable (honouring its
+    settimeout() value, raising socket.timeout like recvfrom does) and
+    returns a list of (data, addr) pairs. On a non-blocking socket it
+    never waits and raises BlockingIOError when the queue is empty.
+    `data` is a memoryview into a reused buffer — it is only valid until
+    the next recv() call.
+    """
+
+    def __init__(self, sock: socket.socket, batch: int = 32, bufsize: int = 2048):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.fd = sock.fileno()
+
+        if not HAVE_RECVMMSG:
+            # recvfrom_into() one persistent buffer instead of allocating
+            # a fresh bytes object per datagram.
+            self._buf = bytearray(bufsize)
+            self._mv = memoryview(self._buf)
+            return
+
+        self._bufs = [bytearray(bufsize) for _ in range(batch)]
+        self._views = [(ctypes.c_char * bufsize).from_buffer(b) for b in self._bufs]
+        self._mvs = [memoryview(b) for b in self._bufs]
+        self._iov = (_IoVec * batch)()
+        self._names = (_SockAddrIn * batch)()
+        self._msgs = (_MMsgHdr * batch)()
+        self._msgs_addr = ctypes.addressof(self._msgs)
+        self.batch = batch
+
+        for i, view in enumerate(self._views):
+            self._iov[i].iov_base = ctypes.addressof(view)
+            self._iov[i].iov_len = bufsize
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = ctypes.addressof(self._names[i])
+
+    def recv(self):
+        """Return [(data, addr), ...] for every datagram drained in one call."""
+        if not HAVE_RECVMMSG:
+            n, addr = self.sock.recvfrom_into(self._buf, self.bufsize)
+            return [(self._mv[:n], addr)]
+
+        timeout = self.sock.gettimeout()
+        if timeout != 0.0:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if not readable:
+                raise socket.timeout("timed out")
+
+        sz = ctypes.sizeof(_SockAddrIn)
+        for i in range(self.batch):
+            self._msgs[i].msg_hdr.msg_namelen = sz
+
+        n = _recvmmsg(self.fd, self._msgs_addr, self.batch, MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                if timeout == 0.0:
+                    raise BlockingIOError(err, os.strerror(err))
+                return []
+            raise OSError(err, os.strerror(err))
+
+        out = []
+        for i in range(n):
+            name = self._names[i]
+            addr = (socket.inet_ntoa(bytes(name.sin_addr)), socket.ntohs(name.sin_port))
+            out.append((self._mvs[i][:self._msgs[i].msg_len], addr))
+        return out
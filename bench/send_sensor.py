@@ -27,52 +27,61 @@ Usage:
 """
 
 import argparse
-import math
-import random
+import functools
 import socket
 import struct
 import time
 
+import numpy as np
+
 
 # ── Wire format ─────────────────────────────────────────────────────
 # Matches sensor_header_t (32 bytes, packed, little-endian):
 #   [ sensor_id: u32 ][ timestamp_us: u64 ][ data_type: u8 ][ reserved: 3 ]
 #   [ payload_len: u16 ][ reserved: 2 ][ seq: u64 ][ padding: 4 ]
 HEADER_FMT = "<IQBxxxHxxQ4x"
-HEADER_SIZE = struct.calcsize(HEADER_FMT)  # 32
+HEADER = struct.Struct(HEADER_FMT)
+HEADER_SIZE = HEADER.size  # 32
 
 DATA_TYPE_AUDIO = 1
 DATA_TYPE_SENSOR_VECTOR = 2
 
 
-def build_packet(sensor_id: int, seq: int, data_type: int, payload: bytes) -> bytes:
-    """Build a binary sensor packet matching the bridge wire format."""
+def build_packet(sensor_id: int, seq: int, data_type: int, payload: bytes,
+                 buf: bytearray) -> memoryview:
+    """Build a sensor packet into the caller's scratch `buf`, returning a view of it.
+
+    `buf` must hold at least HEADER_SIZE + len(payload) bytes; the view is
+    only valid until the next call that reuses it.
+    """
     timestamp_us = int(time.time() * 1_000_000)
-    header = struct.pack(
-        HEADER_FMT,
+    n = HEADER_SIZE + len(payload)
+    HEADER.pack_into(
+        buf, 0,
         sensor_id,
         timestamp_us,
         data_type,
         len(payload),
         seq,
     )
-    return header + payload
+    buf[HEADER_SIZE:n] = payload
+    return memoryview(buf)[:n]
 
 
 # ── Audio payload ───────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=32)
 def make_audio_payload(amplitude: float, n_samples: int = 160) -> bytes:
     """Generate a 16-bit LE PCM sine-wave payload.
 
     `amplitude` controls the peak sample value (0–32767).
     160 samples ≈ 10 ms at 16 kHz – a typical VAD frame.
+    Results are cached per (amplitude, n_samples), so repeated sends reuse
+    the same bytes object.
     """
-    buf = bytearray(n_samples * 2)
-    for i in range(n_samples):
-        sample = int(amplitude * math.sin(2 * math.pi * 440 * i / 16000))
-        sample = max(-32768, min(32767, sample))
-        struct.pack_into("<h", buf, i * 2, sample)
-    return bytes(buf)
+    i = np.arange(n_samples)
+    samples = (amplitude * np.sin(2 * np.pi * 440 * i / 16000)).astype(np.int32)
+    return np.clip(samples, -32768, 32767).astype("<i2").tobytes()
 
 
 # ── Emotional sensor vector payload ────────────────────────────────
@@ -109,22 +118,29 @@ def make_sensor_vector_payload(
     )
 
 
+# Scenario      bat  ppl  kno  unk  fal  lft  idl  snd  voi  mot
+_PRESET_TABLE = {
+    "happy":   (0.0, 0.6, 0.8, 0.0, 0.0, 0.0, 0.0, 0.4, 0.7, 0.3),
+    "scared":  (0.0, 0.3, 0.0, 0.8, 0.5, 0.0, 0.0, 0.6, 0.1, 0.7),
+    "calm":    (0.0, 0.2, 0.5, 0.0, 0.0, 0.0, 0.6, 0.1, 0.2, 0.1),
+    "angry":   (0.0, 0.4, 0.0, 0.6, 0.0, 0.3, 0.0, 0.8, 0.8, 0.6),
+    "lonely":  (0.3, 0.0, 0.0, 0.0, 0.0, 0.0, 0.9, 0.0, 0.0, 0.0),
+    "excited": (0.0, 0.8, 0.7, 0.1, 0.0, 0.0, 0.0, 0.7, 0.6, 0.8),
+}
+
+# Fixed presets are packed once at import; "random" is generated per call.
+_PRESETS = {name: make_sensor_vector_payload(*vals) for name, vals in _PRESET_TABLE.items()}
+PRESET_NAMES = [*_PRESETS, "random"]
+
+
 def make_emotion_preset(name: str) -> bytes:
     """Return a sensor vector for common emotional scenarios."""
-    presets = {
-        # Scenario                          bat  ppl  kno  unk  fal  lft  idl  snd  voi  mot
-        "happy":      make_sensor_vector_payload(0.0, 0.6, 0.8, 0.0, 0.0, 0.0, 0.0, 0.4, 0.7, 0.3),
-        "scared":     make_sensor_vector_payload(0.0, 0.3, 0.0, 0.8, 0.5, 0.0, 0.0, 0.6, 0.1, 0.7),
-        "calm":       make_sensor_vector_payload(0.0, 0.2, 0.5, 0.0, 0.0, 0.0, 0.6, 0.1, 0.2, 0.1),
-        "angry":      make_sensor_vector_payload(0.0, 0.4, 0.0, 0.6, 0.0, 0.3, 0.0, 0.8, 0.8, 0.6),
-        "lonely":     make_sensor_vector_payload(0.3, 0.0, 0.0, 0.0, 0.0, 0.0, 0.9, 0.0, 0.0, 0.0),
-        "excited":    make_sensor_vector_payload(0.0, 0.8, 0.7, 0.1, 0.0, 0.0, 0.0, 0.7, 0.6, 0.8),
-        "random":     make_sensor_vector_payload(*[random.random() for _ in range(10)]),
-    }
-    if name not in presets:
-        print(f"Unknown preset '{name}'. Available: {', '.join(presets.keys())}")
+    if name == "random":
+        return np.random.random(10).astype("<f4").tobytes()
+    if name not in _PRESETS:
+        print(f"Unknown preset '{name}'. Available: {', '.join(PRESET_NAMES)}")
         raise SystemExit(1)
-    return presets[name]
+    return _PRESETS[name]
 
 
 # ── Main ────────────────────────────────────────────────────────────
@@ -217,8 +233,9 @@ Examples:
 
     # Send packets
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    target = (args.host, args.port)
+    sock.connect((args.host, args.port))  # resolve the destination once
     interval = 1.0 / args.rate if args.rate > 0 else 0
+    scratch = bytearray(HEADER_SIZE + len(payload))  # payload size is fixed per run
 
     print(f"🎯 Sending {args.count} packets to {args.host}:{args.port} "
           f"(sensor_id={args.sensor_id}, rate={args.rate} pps)\n")
@@ -228,8 +245,11 @@ Examples:
         if args.mode == "emotion" and args.preset == "random":
             payload = make_emotion_preset("random")
 
-        pkt = build_packet(args.sensor_id, seq, data_type, payload)
-        sock.sendto(pkt, target)
+        pkt = build_packet(args.sensor_id, seq, data_type, payload, scratch)
+        try:
+            sock.send(pkt)
+        except ConnectionRefusedError:
+            print(f"  ⚠ {args.host}:{args.port} unreachable (ICMP port unreachable)")
 
         print(f"  ✉ seq={seq:4d}  size={len(pkt):4d}B  "
               f"type={'audio' if data_type == 1 else 'emotion'}")
@@ -28,14 +28,17 @@ Flags:
     --chunk       samples per ESP packet       (default 700 = 43.75 ms)
     --audio-dir   dir for WAV outputs          (default ./esp_audio)
     --device      input device index           (default: system default)
+    --sndbuf      UDP SO_SNDBUF bytes          (default 2 MiB)
+    --rcvbuf      UDP SO_RCVBUF bytes          (default 2 MiB)
     --list-devices show available audio devices and exit
 
-Requires: pip install sounddevice
+Requires: pip install sounddevice numpy   (optional: soundfile)
 """
 
 import argparse
-import glob
 import os
+import queue
+import selectors
 import signal
 import socket
 import struct
@@ -44,11 +47,23 @@ import threading
 import time
 import wave
 
+import numpy as np
+
+from mmsg import UdpGatherSender
+
+try:
+    import soundfile as sf  # optional: libsndfile decode for compare_wav_files
+except ImportError:
+    sf = None
+
 # ═══════════════════════════════════════════════════════════════════════
 #  ESP protocol constants (mirrors esp_audio_protocol.rs)
 # ═══════════════════════════════════════════════════════════════════════
 
 ESP_HEADER     = 4
+ESP_SEQ        = struct.Struct("<H")  # seq field patched into prebuilt headers
+SEND_BATCH     = 8   # max queued AUDIO_UP packets per sendmmsg() call
+IP_TOS_EF      = 0xB8  # DSCP 46 (Expedited Forwarding) << 2
 PKT_AUDIO_UP   = 0x01
 PKT_CONTROL    = 0x03
 PKT_HEARTBEAT  = 0x04
@@ -79,68 +94,96 @@ def parse_packet(data):
 #  WAV helper + comparison (reused from test_esp_protocol.py)
 # ═══════════════════════════════════════════════════════════════════════
 
+# 44-byte canonical PCM WAV header: RIFF / fmt / data
+WAV_HDR = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
 def write_wav(path, pcm, rate=16000):
-    with wave.open(path, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(rate)
-        wf.writeframes(pcm)
+    """Write 16-bit mono PCM from any bytes-like `pcm` (e.g. an int16 ndarray)."""
+    n = memoryview(pcm).nbytes
+    with open(path, "wb") as fp:
+        fp.write(WAV_HDR.pack(b"RIFF", 36 + n, b"WAVE",
+                              b"fmt ", 16, 1, 1, rate, rate * 2, 2, 16,
+                              b"data", n))
+        fp.write(pcm)
+
+
+def read_wav(path):
+    """Return (rate, int16 ndarray) — one read, decoded in C."""
+    if sf is not None:
+        pcm, rate = sf.read(path, dtype="int16", always_2d=False)
+        return rate, pcm
+    with wave.open(path, "rb") as wf:
+        rate = wf.getframerate()
+        return rate, np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
 
 
 def compare_wav_files(path_a, path_b, label_a="A", label_b="B"):
     print(f"\n  ┌─ Comparing: {label_a} vs {label_b}")
-    with wave.open(path_a, "rb") as wa:
-        rate_a, frames_a = wa.getframerate(), wa.getnframes()
-        data_a = wa.readframes(frames_a)
-    with wave.open(path_b, "rb") as wb:
-        rate_b, frames_b = wb.getframerate(), wb.getnframes()
-        data_b = wb.readframes(frames_b)
+    rate_a, a = read_wav(path_a)
+    rate_b, b = read_wav(path_b)
+    frames_a, frames_b = len(a), len(b)
 
     dur_a = frames_a / rate_a
     dur_b = frames_b / rate_b
-    print(f"  │  {label_a}: {rate_a}Hz {frames_a} frames {len(data_a)}B {dur_a:.3f}s")
-    print(f"  │  {label_b}: {rate_b}Hz {frames_b} frames {len(data_b)}B {dur_b:.3f}s")
+    print(f"  │  {label_a}: {rate_a}Hz {frames_a} frames {a.nbytes}B {dur_a:.3f}s")
+    print(f"  │  {label_b}: {rate_b}Hz {frames_b} frames {b.nbytes}B {dur_b:.3f}s")
 
-    min_len = min(len(data_a), len(data_b))
-    if min_len == 0:
+    n_samples = min(frames_a, frames_b)
+    if n_samples == 0:
         print("  │  ⚠️  One file is empty")
         print("  └─")
         return
 
-    if data_a[:min_len] == data_b[:min_len] and len(data_a) == len(data_b):
+    # Length first, then one vectorized compare — no slice copies.
+    if frames_a == frames_b and np.array_equal(a, b):
         print("  │  ✅ Byte-exact match (identical)")
         print("  └─")
         return
 
-    n_samples = min_len // 2
-    max_diff = 0
-    sum_diff = 0
-    diff_count = 0
-    for i in range(n_samples):
-        sa = struct.unpack_from("<h", data_a, i * 2)[0]
-        sb = struct.unpack_from("<h", data_b, i * 2)[0]
-        d = abs(sa - sb)
-        if d > 0:
-            diff_count += 1
-        max_diff = max(max_diff, d)
-        sum_diff += d
-
-    avg_diff = sum_diff / n_samples if n_samples else 0
-    pct = (1.0 - diff_count / n_samples) * 100 if n_samples else 0
+    # Widen and subtract in one ufunc call, then abs in place: one
+    # int32 temporary instead of two astype() copies plus two results.
+    diff = np.subtract(a[:n_samples], b[:n_samples], dtype=np.int32)
+    np.abs(diff, out=diff)
+    max_diff = int(diff.max())
+    sum_diff = int(diff.sum())
+    diff_count = int(np.count_nonzero(diff))
+
+    avg_diff = sum_diff / n_samples
+    pct = (1.0 - diff_count / n_samples) * 100
 
     print(f"  │  Samples compared: {n_samples}")
     print(f"  │  Identical: {n_samples - diff_count}/{n_samples} ({pct:.1f}%)")
     print(f"  │  Max diff:  {max_diff}   Avg diff: {avg_diff:.2f}")
 
-    if len(data_a) != len(data_b):
-        longer = label_a if len(data_a) > len(data_b) else label_b
-        print(f"  │  Size gap: {longer} has {abs(len(data_a)-len(data_b))} extra bytes")
+    if frames_a != frames_b:
+        longer = label_a if frames_a > frames_b else label_b
+        print(f"  │  Size gap: {longer} has {abs(a.nbytes - b.nbytes)} extra bytes")
 
     verdict = "✅ PASS" if (pct >= 99.9 and max_diff <= 1) else "⚠️  DIFFERS"
     print(f"  │  Verdict: {verdict}")
     print("  └─")
 
 
+def recv_control(sock, sel, timeout=3.0):
+    """Wait up to `timeout` for one small control reply, in 50 ms ticks.
+
+    Raises socket.timeout like a timed recvfrom() would, but Ctrl-C is
+    never stuck behind a single multi-second blocking call.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if sel.select(0.05):
+            return sock.recvfrom(64)[0]  # control replies are ≤ 5 bytes
+    raise socket.timeout("timed out")
+
+
+def snapshot_server_wavs(audio_dir):
+    """Paths of the server's esp_*.wav files in audio_dir (one getdents pass)."""
+    return {e.path for e in os.scandir(audio_dir)
+            if e.name.startswith("esp_") and e.name.endswith(".wav")}
+
+
 # ═══════════════════════════════════════════════════════════════════════
 #  Main
 # ═══════════════════════════════════════════════════════════════════════
@@ -158,6 +201,10 @@ def main():
     ap.add_argument("--audio-dir",   default="./esp_audio")
     ap.add_argument("--device",      type=int, default=None,
                     help="input device index (see --list-devices)")
+    ap.add_argument("--sndbuf",      type=int, default=2 << 20,
+                    help="UDP SO_SNDBUF in bytes (default 2 MiB)")
+    ap.add_argument("--rcvbuf",      type=int, default=2 << 20,
+                    help="UDP SO_RCVBUF in bytes (default 2 MiB)")
     ap.add_argument("--list-devices", action="store_true",
                     help="show audio devices and exit")
     args = ap.parse_args()
@@ -165,7 +212,6 @@ def main():
     # ── optional: list devices ─────────────────────────────────────
     try:
         import sounddevice as sd
-        import numpy as np
     except ImportError:
         print("❌ sounddevice required:  pip install sounddevice")
         sys.exit(1)
@@ -177,6 +223,28 @@ def main():
     server = (args.host, args.port)
     os.makedirs(args.audio_dir, exist_ok=True)
 
+    # ── UDP socket ─────────────────────────────────────────────────
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", 0))
+    # Replies are awaited via the selector, so the socket itself stays
+    # blocking (a timeout would make the fd O_NONBLOCK under sendmmsg()).
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    # Connected once: the kernel skips the per-packet route/address lookup,
+    # and every send below (including the sendmmsg() batches) omits it.
+    sock.connect(server)
+    # Linux caps these at net.core.{w,r}mem_max (and reports double)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, args.sndbuf)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+    # Mark AUDIO_UP as low-latency voice like a real device would: DSCP EF
+    # for switches/APs, plus the matching qdisc band on Linux.
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, IP_TOS_EF)
+        if hasattr(socket, "SO_PRIORITY"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, 6)
+    except OSError:
+        pass
+
     # ── banner ─────────────────────────────────────────────────────
     dev_name = "(system default)"
     if args.device is not None:
@@ -191,21 +259,19 @@ def main():
     print(f"  Chunk      : {args.chunk} samples ({args.chunk/args.samplerate*1000:.1f} ms)")
     print(f"  Duration   : {args.duration:.1f}s")
     print(f"  Audio dir  : {args.audio_dir}")
+    print(f"  Socket bufs: "
+          f"SO_SNDBUF={sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) // 1024} KB  "
+          f"SO_RCVBUF={sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 1024} KB")
     print()
 
-    # ── UDP socket ─────────────────────────────────────────────────
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(3.0)
-    sock.bind(("0.0.0.0", 0))
-
     # ── Snapshot existing server WAVs ──────────────────────────────
-    existing_wavs = set(glob.glob(os.path.join(args.audio_dir, "esp_*.wav")))
+    existing_wavs = snapshot_server_wavs(args.audio_dir)
 
     # ── 1. SESSION_START ───────────────────────────────────────────
     print("🔹 SESSION_START …", end=" ", flush=True)
-    sock.sendto(build_control(0, CTRL_SESSION_START, FLAG_START), server)
+    sock.send(build_control(0, CTRL_SESSION_START, FLAG_START))
     try:
-        data, _ = sock.recvfrom(1500)
+        data = recv_control(sock, sel)
         r = parse_packet(data)
         if r and r[1] == PKT_CONTROL and r[3] and r[3][0] == CTRL_SERVER_READY:
             print("✅ SERVER_READY")
@@ -215,10 +281,14 @@ def main():
     except socket.timeout:
         print("❌ timeout (is the server running?)")
         sys.exit(1)
+    except ConnectionRefusedError:
+        print("❌ connection refused (is the server running?)")
+        sys.exit(1)
 
     # ── 2. Capture mic + stream AUDIO_UP ───────────────────────────
-    sent_pcm = bytearray()
-    seq = 0
+    seq = 0   # complete chunks captured (written only by the audio callback)
+    pos = 0   # samples captured
+    overruns = 0  # input overflows reported by PortAudio
     stop = threading.Event()
 
     def on_sig(s, f):
@@ -227,38 +297,102 @@ def main():
 
     chunk_ms = args.chunk / args.samplerate * 1000
     total_chunks = int(args.duration * 1000 / chunk_ms)
+    # Preallocated capture buffer — no growth on the audio path
+    sent_pcm = np.empty(total_chunks * args.chunk, dtype=np.int16)
 
     print(f"🎙️  Recording {args.duration:.1f}s ({total_chunks} chunks) …")
 
-    t0 = time.monotonic()
-    with sd.InputStream(samplerate=args.samplerate, blocksize=args.chunk,
-                        channels=1, dtype="int16", device=args.device) as stream:
-        while seq < total_chunks and not stop.is_set():
-            frames, overflowed = stream.read(args.chunk)
-            pcm = frames.tobytes()
-
-            sent_pcm.extend(pcm)
-            seq += 1
-
-            pkt = build_packet(seq, PKT_AUDIO_UP, 0, pcm)
-            sock.sendto(pkt, server)
-
-            # live status
-            elapsed = time.monotonic() - t0
+    # Network I/O runs on its own thread so a stalled send never holds up
+    # the audio callback, which only enqueues sequence numbers (the PCM is
+    # already in sent_pcm). Whatever has queued up by the time the
+    # sender wakes goes out in one sendmmsg(). Each datagram is a prebuilt
+    # AUDIO_UP header (only the seq is patched) gathered with its PCM slice
+    # straight out of sent_pcm — the audio is never copied again.
+    tx_q = queue.SimpleQueue()
+    chunk_bytes = args.chunk * 2
+    tx_hdrs = [bytearray(build_packet(0, PKT_AUDIO_UP, 0)) for _ in range(SEND_BATCH)]
+    tx_offs = [0] * SEND_BATCH
+    tx = UdpGatherSender(sock, None, tx_hdrs, sent_pcm, chunk_bytes)
+
+    def sender():
+        # Chunks arrive strictly in order, so the wire seq and PCM offset
+        # are running counters — the queued item only says "chunk ready".
+        seq_lo = 0
+        off = 0
+        done = False
+        while not done:
+            batch = [tx_q.get()]
+            while len(batch) < SEND_BATCH:
+                try:
+                    batch.append(tx_q.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:  # sentinel is always the last item queued
+                batch.pop()
+                done = True
+            for i in range(len(batch)):
+                seq_lo = (seq_lo + 1) & 0xFFFF
+                ESP_SEQ.pack_into(tx_hdrs[i], 0, seq_lo)
+                tx_offs[i] = off
+                off += chunk_bytes
+            if batch:
+                tx.send(len(batch), tx_offs)
+
+    send_thread = threading.Thread(target=sender, daemon=True, name="send")
+    send_thread.start()
+
+    # Live status from a background thread at 5 Hz — no stdout writes on
+    # the capture path. It only reads `seq`, which the audio callback owns.
+    capture_done = threading.Event()
+
+    def status():
+        while not capture_done.wait(0.2):
             print(f"\r   📦 {seq}/{total_chunks}  "
-                  f"⏱ {elapsed:.1f}s  "
-                  f"📤 {len(sent_pcm)/1024:.0f} KB sent",
+                  f"⏱ {time.monotonic() - t0:.1f}s  "
+                  f"📤 {seq * chunk_bytes/1024:.0f} KB sent",
                   end="", flush=True)
 
+    # PortAudio callback: copy the block into sent_pcm and hand every
+    # completed chunk to the sender. No blocking read sets the send cadence.
+    def on_audio(indata, frames, time_info, status_flags):
+        nonlocal seq, pos, overruns
+        if status_flags.input_overflow:
+            overruns += 1
+        n = min(frames, len(sent_pcm) - pos)  # one copy: driver block → sent_pcm
+        sent_pcm[pos:pos + n] = indata[:n, 0]
+        pos += n
+        while (seq + 1) * args.chunk <= pos:
+            seq += 1
+            tx_q.put(seq)
+        if seq >= total_chunks:
+            capture_done.set()
+            raise sd.CallbackStop
+
+    t0 = time.monotonic()
+    status_thread = threading.Thread(target=status, daemon=True, name="status")
+    status_thread.start()
+    with sd.InputStream(samplerate=args.samplerate, blocksize=args.chunk,
+                        channels=1, dtype="int16", device=args.device,
+                        callback=on_audio):
+        while not stop.is_set() and not capture_done.wait(0.1):
+            pass
+
+    capture_done.set()
+    status_thread.join()
+    tx_q.put(None)
+    send_thread.join()
+    sent_pcm = sent_pcm[:seq * args.chunk]  # short if interrupted
     dt = time.monotonic() - t0
     print(f"\n   done — {seq} packets in {dt:.2f}s "
-          f"({len(sent_pcm)/1024:.1f} KB)")
+          f"({sent_pcm.nbytes/1024:.1f} KB)")
+    if overruns:
+        print(f"   ⚠️  {overruns} mic input overflow(s) — capture has gaps")
 
     # ── 3. SESSION_END ─────────────────────────────────────────────
     print("🔹 SESSION_END …", end=" ", flush=True)
-    sock.sendto(build_control(seq + 1, CTRL_SESSION_END, FLAG_END), server)
+    sock.send(build_control(seq + 1, CTRL_SESSION_END, FLAG_END))
     try:
-        data, _ = sock.recvfrom(1500)
+        data = recv_control(sock, sel)
         r = parse_packet(data)
         if r and r[1] == PKT_CONTROL and r[3] and r[3][0] == CTRL_ACK:
             print("✅ ACK")
@@ -266,20 +400,22 @@ def main():
             print("⚠️  unexpected reply")
     except socket.timeout:
         print("⚠️  timeout")
+    except ConnectionRefusedError:
+        print("⚠️  connection refused")
 
+    sel.close()
     sock.close()
 
     # ── 4. Save sent WAV ───────────────────────────────────────────
     sent_path = os.path.join(args.audio_dir, "mic_sent.wav")
-    write_wav(sent_path, bytes(sent_pcm), args.samplerate)
-    sent_dur = len(sent_pcm) / (args.samplerate * 2)
+    write_wav(sent_path, sent_pcm, args.samplerate)
+    sent_dur = len(sent_pcm) / args.samplerate
     print(f"💾 Mic audio saved:    {sent_path}  "
-          f"({len(sent_pcm)} bytes, {sent_dur:.2f}s)")
+          f"({sent_pcm.nbytes} bytes, {sent_dur:.2f}s)")
 
     # ── 5. Find server WAV ─────────────────────────────────────────
     time.sleep(0.5)
-    current_wavs = set(glob.glob(os.path.join(args.audio_dir, "esp_*.wav")))
-    new_wavs = current_wavs - existing_wavs
+    new_wavs = snapshot_server_wavs(args.audio_dir) - existing_wavs
 
     if new_wavs:
         server_path = sorted(new_wavs)[-1]
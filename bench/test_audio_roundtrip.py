@@ -45,8 +45,10 @@ Requires: pip install sounddevice numpy
 """
 
 import argparse
+import mmap
 import os
 import queue
+import selectors
 import signal
 import socket
 import struct
@@ -55,11 +57,27 @@ import threading
 import time
 import wave
 
+from audiobuf import ByteRing, wav_data_offset
+from mmsg import UdpBatchReceiver, UdpBatchSender, UdpGatherSender
+
+# Imported once here rather than inside the send paths; main() reports
+# which one is missing for the chosen input mode.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import sounddevice as sd  # mic capture only
+except (ImportError, OSError):  # OSError: PortAudio library not found
+    sd = None
+
 # ═══════════════════════════════════════════════════════════════════════
 #  ESP Protocol constants (mirrors esp_audio_protocol.rs)
 # ═══════════════════════════════════════════════════════════════════════
 
 ESP_HEADER = 4
+ESP_HDR = struct.Struct("<HBB")  # seq: u16, type: u8, flags: u8
 MAX_PAYLOAD = 1400  # bytes — fits inside a single UDP packet under MTU
 
 PKT_AUDIO_UP   = 0x01
@@ -80,6 +98,19 @@ BYTES_PER_SAMPLE = 2   # 16-bit PCM
 CHUNK_SAMPLES = 700    # 43.75 ms per packet (matches ESP protocol)
 CHUNK_BYTES = CHUNK_SAMPLES * BYTES_PER_SAMPLE
 
+# io_uring receive path (--iouring)
+URING_RX_BUFS = 64     # kernel-selected 2 KB receive buffers
+_UD_PROVIDE = 1        # user_data tags for the two SQE kinds
+_UD_RECV = 2
+PCM_PREALLOC_SECS = 60  # initial capacity of each PCM buffer (grows if exceeded)
+RECV_RING_BYTES = 4 << 20  # receiver → main handoff ring (~130s of audio)
+CONTROL_TIMEOUT = 5.0  # seconds to wait for SERVER_READY / ACK
+MIC_SEND_BATCH = 8     # max mic chunks per sendmmsg() when capture runs ahead
+
+# Progress lines for the send loops (%-formatted; byte counts shown >> 10)
+_MIC_PROGRESS = "\r   📦 %d/%d  ⏱ %.1fs  📤 %d KB sent  📥 %d KB recv"
+_WAV_PROGRESS = "\r   📦 chunk %d  ⏱ %.1fs  📤 %d KB sent  📥 %d KB recv"
+
 CTRL_NAMES = {
     CTRL_SESSION_START: "SESSION_START",
     CTRL_SESSION_END:   "SESSION_END",
@@ -96,7 +127,7 @@ CTRL_NAMES = {
 # ═══════════════════════════════════════════════════════════════════════
 
 def build_packet(seq: int, pkt_type: int, flags: int, payload: bytes = b"") -> bytes:
-    return struct.pack("<HBB", seq & 0xFFFF, pkt_type, flags) + payload
+    return ESP_HDR.pack(seq & 0xFFFF, pkt_type, flags) + payload
 
 def build_control(seq: int, cmd: int, flags: int = 0) -> bytes:
     return build_packet(seq, PKT_CONTROL, flags, bytes([cmd]))
@@ -105,7 +136,7 @@ def parse_packet(data: bytes):
     """Return (seq, pkt_type, flags, payload) or None."""
     if len(data) < ESP_HEADER:
         return None
-    seq, pkt_type, flags = struct.unpack("<HBB", data[:ESP_HEADER])
+    seq, pkt_type, flags = ESP_HDR.unpack_from(data)
     return seq, pkt_type, flags, data[ESP_HEADER:]
 
 
@@ -113,8 +144,8 @@ def parse_packet(data: bytes):
 #  WAV writer helper
 # ═══════════════════════════════════════════════════════════════════════
 
-def write_wav(path: str, pcm: bytes, rate: int = SAMPLE_RATE):
-    """Write raw 16-bit mono PCM bytes to a WAV file."""
+def write_wav(path: str, pcm, rate: int = SAMPLE_RATE):
+    """Write raw 16-bit mono PCM (any bytes-like object) to a WAV file."""
     with wave.open(path, "wb") as wf:
         wf.setnchannels(1)
         wf.setsampwidth(BYTES_PER_SAMPLE)
@@ -122,6 +153,35 @@ def write_wav(path: str, pcm: bytes, rate: int = SAMPLE_RATE):
         wf.writeframes(pcm)
 
 
+class PcmBuffer:
+    """
+    Append-only PCM accumulator backed by one preallocated bytearray.
+
+    Appends copy into the buffer in place; it only reallocates (doubling)
+    if a session outgrows the initial capacity. view() exposes the filled
+    part without copying.
+    """
+
+    def __init__(self, capacity: int):
+        self.buf = bytearray(capacity)
+        self.used = 0
+
+    def __len__(self) -> int:
+        return self.used
+
+    def append(self, data):
+        end = self.used + len(data)
+        if end > len(self.buf):
+            grown = bytearray(max(2 * len(self.buf), end))
+            grown[:self.used] = memoryview(self.buf)[:self.used]
+            self.buf = grown
+        self.buf[self.used:end] = data
+        self.used = end
+
+    def view(self) -> memoryview:
+        return memoryview(self.buf)[:self.used]
+
+
 # ═══════════════════════════════════════════════════════════════════════
 #  Audio Round-Trip Client
 # ═══════════════════════════════════════════════════════════════════════
@@ -134,26 +194,54 @@ class AudioRoundTripTest:
 
     def __init__(self, host: str, port: int, output_dir: str,
                  input_device=None, wav_input: str = None,
-                 response_timeout: float = 15.0):
+                 response_timeout: float = 15.0, send_batch: int = 1,
+                 udp_rcvbuf: int = 4 << 20, udp_sndbuf: int = 1 << 20,
+                 iouring: bool = False):
         self.host = host
         self.port = port
         self.output_dir = output_dir
         self.input_device = input_device
         self.wav_input = wav_input
         self.response_timeout = response_timeout
-
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.settimeout(5.0)
-        self.sock.bind(("0.0.0.0", 0))  # ephemeral port
+        self.send_batch = send_batch
+        self.iouring = iouring
+
+        # Separate rx/tx sockets on one local port, so the receiver thread
+        # and the send loops never share a socket lock or buffer. Both set
+        # SO_REUSEPORT; the rx socket is connect()ed to the server, which
+        # makes it the exact match for every reply (an unconnected tx
+        # socket would otherwise take a share of them). Without
+        # SO_REUSEPORT a single socket does both jobs.
         self.server_addr = (host, port)
-        self.local_port = self.sock.getsockname()[1]
+        reuse = hasattr(socket, "SO_REUSEPORT")
+        self.sock_rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse:
+            self.sock_rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Response audio arrives in bursts well beyond the ~208 KB Linux
+        # default; the kernel caps these at net.core.{r,w}mem_max.
+        self.sock_rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, udp_rcvbuf)
+        self.sock_rx.bind(("0.0.0.0", 0))  # ephemeral port
+        self.local_port = self.sock_rx.getsockname()[1]
+
+        if reuse:
+            self.sock_tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock_tx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.sock_tx.bind(("0.0.0.0", self.local_port))
+            self.sock_rx.connect(self.server_addr)
+        else:
+            self.sock_tx = self.sock_rx
+        self.sock_tx.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, udp_sndbuf)
 
         self.seq_out = 0
         self.running = False
 
         # Buffers
-        self.sent_pcm = bytearray()
-        self.recv_pcm = bytearray()
+        prealloc = SAMPLE_RATE * BYTES_PER_SAMPLE * PCM_PREALLOC_SECS
+        self.sent_pcm = PcmBuffer(prealloc)
+        self.recv_pcm = PcmBuffer(prealloc)
+        # AUDIO_DOWN handoff: the receiver thread only pushes here; the
+        # main thread drains into recv_pcm while waiting and at the end.
+        self.recv_ring = ByteRing(RECV_RING_BYTES)
 
         # Stats
         self.pkts_sent = 0
@@ -161,10 +249,25 @@ class AudioRoundTripTest:
         self.bytes_sent = 0
         self.bytes_recv = 0
 
-        # Events
+        # Events — control replies are picked up by the receiver thread,
+        # which is the only reader of the socket.
+        self.ready_event = threading.Event()
+        self.ack_event = threading.Event()
         self.stream_end_event = threading.Event()
         self.stop_event = threading.Event()
 
+        # Packet type → handler(seq, flags, payload); unknown types are ignored
+        self._dispatch_get = {
+            PKT_AUDIO_DOWN: self._on_audio_down,
+            PKT_CONTROL:    self._on_control,
+            PKT_HEARTBEAT:  self._on_heartbeat,
+        }.get
+
+    def close(self):
+        self.sock_rx.close()
+        if self.sock_tx is not self.sock_rx:
+            self.sock_tx.close()
+
     def next_seq(self) -> int:
         s = self.seq_out
         self.seq_out = (self.seq_out + 1) & 0xFFFF
@@ -175,93 +278,206 @@ class AudioRoundTripTest:
     def session_start(self) -> bool:
         """Send SESSION_START, wait for SERVER_READY."""
         pkt = build_control(self.next_seq(), CTRL_SESSION_START)
-        self.sock.sendto(pkt, self.server_addr)
+        self.sock_tx.sendto(pkt, self.server_addr)
         print("📞 SESSION_START sent → waiting for SERVER_READY …")
 
-        try:
-            data, _ = self.sock.recvfrom(2048)
-            parsed = parse_packet(data)
-            if parsed:
-                _, pkt_type, _, payload = parsed
-                if (pkt_type == PKT_CONTROL and len(payload) > 0
-                        and payload[0] == CTRL_SERVER_READY):
-                    print("✅ SERVER_READY received — session active")
-                    return True
-        except socket.timeout:
-            print("❌ Timeout waiting for SERVER_READY")
-            print("   Is the Rust server running with --openai-realtime?")
-            return False
-
-        print("❌ Unexpected response from server")
+        if self.ready_event.wait(CONTROL_TIMEOUT):
+            print("✅ SERVER_READY received — session active")
+            return True
+
+        print("❌ Timeout waiting for SERVER_READY")
+        print("   Is the Rust server running with --openai-realtime?")
         return False
 
     def session_end(self):
         """Send SESSION_END, wait for ACK."""
         pkt = build_control(self.next_seq(), CTRL_SESSION_END)
-        self.sock.sendto(pkt, self.server_addr)
+        self.sock_tx.sendto(pkt, self.server_addr)
         print("📴 SESSION_END sent → waiting for ACK …")
 
-        try:
-            data, _ = self.sock.recvfrom(2048)
-            parsed = parse_packet(data)
-            if parsed:
-                _, pkt_type, _, payload = parsed
-                if pkt_type == PKT_CONTROL and len(payload) > 0 and payload[0] == CTRL_ACK:
-                    print("✅ ACK received")
-                    return
-        except socket.timeout:
-            pass
+        if self.ack_event.wait(CONTROL_TIMEOUT):
+            print("✅ ACK received")
+            return
         print("⚠️  No ACK received (continuing anyway)")
 
     # ── Receiver thread ────────────────────────────────────────────
 
     def receiver_loop(self):
-        """Receive AUDIO_DOWN packets and heartbeats from the server."""
-        self.sock.settimeout(0.5)
+        """Receive AUDIO_DOWN packets and heartbeats from the server.
+
+        Each wake-up drains up to 32 queued datagrams with one recvmmsg()
+        (plain recvfrom() off Linux). AUDIO_DOWN — nearly every packet —
+        is handled inline: type byte checked in place, payload pushed
+        straight into the ring, counters published once per batch.
+        Everything else goes through handle_packet().
+        """
+        self.sock_rx.settimeout(0.5)
+        rx = UdpBatchReceiver(self.sock_rx, batch=32, bufsize=2048)
+        push = self.recv_ring.push
+        handle = self.handle_packet
 
         while self.running:
             try:
-                data, _ = self.sock.recvfrom(2048)
-            except socket.timeout:
-                continue
+                batch = rx.recv()
+            except (socket.timeout, ConnectionRefusedError):
+                continue  # refused: ICMP for an earlier send, reported on rx
             except Exception as e:
                 if self.running:
                     print(f"⚠️  recv error: {e}", file=sys.stderr)
                 break
 
-            parsed = parse_packet(data)
-            if not parsed:
-                continue
-
-            seq, pkt_type, flags, payload = parsed
-
-            if pkt_type == PKT_AUDIO_DOWN and payload:
-                self.recv_pcm.extend(payload)
-                self.pkts_recv += 1
-                self.bytes_recv += len(payload)
-
-            elif pkt_type == PKT_CONTROL and len(payload) > 0:
-                cmd = payload[0]
-                cmd_name = CTRL_NAMES.get(cmd, f"0x{cmd:02x}")
-                if cmd == CTRL_STREAM_END:
-                    print(f"   🔊 STREAM_END — OpenAI response audio complete")
-                    self.stream_end_event.set()
-                elif cmd == CTRL_STREAM_START:
-                    print(f"   🔊 STREAM_START — receiving OpenAI response …")
+            pkts = nbytes = 0
+            for data, _ in batch:
+                if len(data) > ESP_HEADER and data[2] == PKT_AUDIO_DOWN:
+                    if push(data[ESP_HEADER:]):
+                        pkts += 1
+                        nbytes += len(data) - ESP_HEADER
                 else:
-                    print(f"   📩 Control: {cmd_name}")
+                    handle(data)
+            if pkts:
+                self.pkts_recv += pkts
+                self.bytes_recv += nbytes
+
+    def receiver_loop_iouring(self):
+        """receiver_loop on io_uring: one multishot recv, kernel-picked buffers.
+
+        A single IORING_OP_RECV with IOSQE_BUFFER_SELECT stays armed and
+        completes once per datagram into one of URING_RX_BUFS provided
+        buffers, so a burst costs one wait instead of a syscall per packet.
+        Each buffer is handed back to the kernel once its packet has been
+        dispatched; if the pool runs dry (ENOBUFS) the recv is re-armed and
+        picks up whatever is still queued on the socket.
+
+        The liburing binding holds the GIL inside its wait calls, which
+        would stall the sender and main threads for the whole wait. So
+        the thread blocks in a selector on the ring fd (readable once
+        completions are posted) and only peeks at the CQ, which never
+        waits.
+        """
+        import liburing
+
+        ring = liburing.Ring()
+        liburing.io_uring_queue_init(2 * URING_RX_BUFS, ring, 0)
+        fd = self.sock_rx.fileno()
+        bufs = [bytearray(2048) for _ in range(URING_RX_BUFS)]
+        views = [memoryview(b) for b in bufs]
+
+        def get_sqe():
+            sqe = liburing.io_uring_get_sqe(ring)
+            if sqe is None:  # SQ full — flush and retry
+                liburing.io_uring_submit(ring)
+                sqe = liburing.io_uring_get_sqe(ring)
+            return sqe
+
+        def provide(bid):
+            sqe = get_sqe()
+            liburing.io_uring_prep_provide_buffers(sqe, bufs[bid], 1, 0, bid)
+            sqe.user_data = _UD_PROVIDE
+
+        def arm():
+            sqe = get_sqe()
+            liburing.io_uring_prep_recv_multishot(sqe, fd)
+            sqe.flags |= liburing.IOSQE_BUFFER_SELECT
+            sqe.user_data = _UD_RECV
+
+        for bid in range(URING_RX_BUFS):
+            provide(bid)
+        arm()
+        liburing.io_uring_submit(ring)
+
+        cqe = liburing.Cqe()
+        # cqe[i] indexes the CQ (twice the power-of-two rounded SQ)
+        # linearly from the head without wrapping, so track the head and
+        # stop each pass at the wrap; the rest is picked up next pass.
+        cq_size = 2 << (2 * URING_RX_BUFS - 1).bit_length()
+        cq_head = 0
+        sel = selectors.DefaultSelector()
+        sel.register(ring.ring_fd, selectors.EVENT_READ)
+        try:
+            while self.running:
+                # 0.5s timeout so `running` is re-checked
+                if not sel.select(timeout=0.5):
+                    continue
+                try:
+                    liburing.io_uring_peek_cqe(ring, cqe)
+                except BlockingIOError:
+                    continue  # woken without a completion
+
+                ready = liburing.io_uring_cq_ready(ring)
+                ready = min(ready, cq_size - (cq_head & (cq_size - 1)))
+                for i in range(ready):
+                    c = cqe[i]
+                    user_data, flags = c.user_data, c.flags
+                    try:
+                        n = c.res  # the binding raises OSError for res < 0
+                    except OSError:
+                        if user_data == _UD_RECV:
+                            arm()  # ENOBUFS & co. end the multishot
+                        continue
+                    if user_data != _UD_RECV:
+                        continue
+                    bid = flags >> 16  # IORING_CQE_BUFFER_SHIFT
+                    self.handle_packet(views[bid][:n])
+                    provide(bid)
+                    if not flags & liburing.IORING_CQE_F_MORE:
+                        arm()
+                liburing.io_uring_cq_advance(ring, ready)
+                cq_head += ready
+                liburing.io_uring_submit(ring)
+        except Exception as e:
+            if self.running:
+                print(f"⚠️  io_uring recv error: {e}", file=sys.stderr)
+        finally:
+            sel.close()
+            liburing.io_uring_queue_exit(ring)
+
+    def handle_packet(self, data):
+        """Dispatch one datagram (may be a view into the receiver's batch buffer)."""
+        parsed = parse_packet(data)
+        if not parsed:
+            return
+
+        seq, pkt_type, flags, payload = parsed
+        handler = self._dispatch_get(pkt_type)
+        if handler is not None:
+            handler(seq, flags, payload)
 
-            elif pkt_type == PKT_HEARTBEAT:
-                reply = build_packet(seq, PKT_HEARTBEAT, 0)
-                self.sock.sendto(reply, self.server_addr)
+    def _on_audio_down(self, seq, flags, payload):
+        if payload and self.recv_ring.push(payload):
+            self.pkts_recv += 1
+            self.bytes_recv += len(payload)
+
+    def _on_control(self, seq, flags, payload):
+        if not payload:
+            return
+        cmd = payload[0]
+        if cmd == CTRL_SERVER_READY:
+            self.ready_event.set()
+        elif cmd == CTRL_ACK:
+            self.ack_event.set()
+        elif cmd == CTRL_STREAM_END:
+            print(f"   🔊 STREAM_END — OpenAI response audio complete")
+            self.stream_end_event.set()
+        elif cmd == CTRL_STREAM_START:
+            print(f"   🔊 STREAM_START — receiving OpenAI response …")
+        else:
+            print(f"   📩 Control: {CTRL_NAMES.get(cmd, f'0x{cmd:02x}')}")
+
+    def _on_heartbeat(self, seq, flags, payload):
+        # sock_tx is never connected (sendto() on a connected socket is
+        # EISCONN on macOS/BSD) and shares sock_rx's port, so the reply
+        # still comes from the address the server knows.
+        self.sock_tx.sendto(build_packet(seq, PKT_HEARTBEAT, 0), self.server_addr)
+
+    def drain_recv(self):
+        """Main thread: move everything the receiver has pushed into recv_pcm."""
+        for chunk in self.recv_ring.pop_all():
+            self.recv_pcm.append(chunk)
 
     # ── Mic capture + send ─────────────────────────────────────────
 
     def send_mic_audio(self, duration: float):
         """Capture audio from mic and stream as AUDIO_UP packets."""
-        import sounddevice as sd
-        import numpy as np
-
         dev_name = "(system default)"
         if self.input_device is not None:
             dev_name = sd.query_devices(self.input_device)["name"]
@@ -272,39 +488,70 @@ class AudioRoundTripTest:
         print()
 
         total_chunks = int(duration * SAMPLE_RATE / CHUNK_SAMPLES)
+
+        # Callback-mode capture: PortAudio's callback copies each block
+        # straight into one preallocated session array and posts how many
+        # whole chunks are filled; this thread sends them as header +
+        # array-slice datagrams (sendmmsg, no packet-buffer copy). Chunks
+        # are fixed-size, so every seq number is known up front.
+        pcm = np.empty(total_chunks * CHUNK_SAMPLES, dtype=np.int16)
+        seqs = ((self.seq_out + np.arange(total_chunks)) & 0xFFFF).astype("<u2")
+        seq_bytes = memoryview(seqs).cast("B")
+        tx_hdrs = [bytearray(build_packet(0, PKT_AUDIO_UP, 0)) for _ in range(MIC_SEND_BATCH)]
+        tx_offs = [0] * MIC_SEND_BATCH
+        tx = UdpGatherSender(self.sock_tx, self.server_addr, tx_hdrs, pcm, CHUNK_BYTES)
+        ready = queue.SimpleQueue()
+        filled = 0
+        overruns = 0
+
+        def on_audio(indata, frames, time_info, status):
+            nonlocal filled, overruns
+            if status.input_overflow:
+                overruns += 1
+            n = min(frames, len(pcm) - filled)
+            pcm[filled:filled + n] = indata[:n, 0]
+            filled += n
+            ready.put(filled // CHUNK_SAMPLES)
+            if filled >= len(pcm):
+                raise sd.CallbackStop
+
+        sent = 0
         t0 = time.monotonic()
 
         with sd.InputStream(samplerate=SAMPLE_RATE, blocksize=CHUNK_SAMPLES,
-                            channels=1, dtype="int16", device=self.input_device) as stream:
-            for i in range(total_chunks):
-                if self.stop_event.is_set():
-                    break
-
-                frames, overflowed = stream.read(CHUNK_SAMPLES)
-                if overflowed:
-                    print("⚠️  mic buffer overflow", file=sys.stderr)
-
-                pcm = frames.tobytes()
-                self.sent_pcm.extend(pcm)
-
-                # Split into ESP-sized chunks (usually fits in one)
-                for offset in range(0, len(pcm), MAX_PAYLOAD):
-                    chunk = pcm[offset:offset + MAX_PAYLOAD]
-                    pkt = build_packet(self.next_seq(), PKT_AUDIO_UP, 0, chunk)
-                    self.sock.sendto(pkt, self.server_addr)
-                    self.pkts_sent += 1
-                    self.bytes_sent += len(chunk)
+                            channels=1, dtype="int16", device=self.input_device,
+                            callback=on_audio):
+            while sent < total_chunks and not self.stop_event.is_set():
+                try:
+                    avail = ready.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                while not ready.empty():
+                    avail = ready.get_nowait()
+
+                while sent < avail:
+                    n = min(MIC_SEND_BATCH, avail - sent)
+                    for k in range(n):
+                        j = sent + k
+                        tx_hdrs[k][0:2] = seq_bytes[2 * j:2 * j + 2]
+                        tx_offs[k] = j * CHUNK_BYTES
+                    tx.send(n, tx_offs)
+                    sent += n
+                    self.pkts_sent += n
+                    self.bytes_sent += n * CHUNK_BYTES
 
                 # Progress
                 elapsed = time.monotonic() - t0
-                sys.stdout.write(
-                    f"\r   📦 {i+1}/{total_chunks}  "
-                    f"⏱ {elapsed:.1f}s  "
-                    f"📤 {self.bytes_sent / 1024:.0f} KB sent  "
-                    f"📥 {self.bytes_recv / 1024:.0f} KB recv"
-                )
+                sys.stdout.write(_MIC_PROGRESS % (sent, total_chunks, elapsed,
+                                                  self.bytes_sent >> 10, self.bytes_recv >> 10))
                 sys.stdout.flush()
 
+        self.seq_out = (self.seq_out + sent) & 0xFFFF
+        self.sent_pcm.append(memoryview(pcm[:sent * CHUNK_SAMPLES]).cast("B"))
+        if overruns:
+            print(f"\n⚠️  mic input overflowed {overruns}× (PortAudio dropped samples)",
+                  file=sys.stderr)
+
         dt = time.monotonic() - t0
         print(f"\n   ✅ Mic capture done — {self.pkts_sent} packets, "
               f"{self.bytes_sent / 1024:.1f} KB in {dt:.1f}s")
@@ -326,43 +573,70 @@ class AudioRoundTripTest:
         print(f"   Duration: {audio_secs:.1f}s, {rate} Hz, 16-bit mono")
         print()
 
-        chunk_samples = CHUNK_SAMPLES
-        chunk_duration = chunk_samples / rate
-        t0 = time.monotonic()
-
-        with wave.open(self.wav_input, "rb") as wf:
-            chunk_idx = 0
-            while not self.stop_event.is_set():
-                pcm = wf.readframes(chunk_samples)
-                if not pcm:
-                    break
-
-                self.sent_pcm.extend(pcm)
-
-                for offset in range(0, len(pcm), MAX_PAYLOAD):
-                    chunk = pcm[offset:offset + MAX_PAYLOAD]
-                    pkt = build_packet(self.next_seq(), PKT_AUDIO_UP, 0, chunk)
-                    self.sock.sendto(pkt, self.server_addr)
-                    self.pkts_sent += 1
-                    self.bytes_sent += len(chunk)
-
-                chunk_idx += 1
-
-                # Pace to approximately real-time
-                target_time = t0 + chunk_idx * chunk_duration
-                now = time.monotonic()
-                if now < target_time:
-                    time.sleep(target_time - now)
-
-                # Progress
-                elapsed = time.monotonic() - t0
-                sys.stdout.write(
-                    f"\r   📦 chunk {chunk_idx}  "
-                    f"⏱ {elapsed:.1f}s  "
-                    f"📤 {self.bytes_sent / 1024:.0f} KB sent  "
-                    f"📥 {self.bytes_recv / 1024:.0f} KB recv"
-                )
-                sys.stdout.flush()
+        # Map the file instead of readframes() and send each chunk as
+        # header + slice of the mapping (UdpGatherSender), so the samples
+        # go from the page cache to the kernel without a copy in between.
+        # ACCESS_COPY only because ctypes needs a writable buffer to take
+        # the payload's address; nothing is ever written to it.
+        chunk_duration = CHUNK_SAMPLES / rate
+        batch = self.send_batch
+        with open(self.wav_input, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) as mm:
+            data_off = wav_data_offset(mm)
+            raw = memoryview(mm)[data_off:data_off + n_frames * BYTES_PER_SAMPLE]
+            tx = tail = None
+            try:
+                # Full chunks go out `send_batch` per sendmmsg() (with the
+                # default of 1 pacing is per-packet); a short trailing
+                # chunk goes out on its own.
+                n_full = len(raw) // CHUNK_BYTES
+                tail = raw[n_full * CHUNK_BYTES:]
+                tx_hdrs = [bytearray(build_packet(0, PKT_AUDIO_UP, 0)) for _ in range(batch)]
+                tx_offs = [0] * batch
+                tx = UdpGatherSender(self.sock_tx, self.server_addr, tx_hdrs, raw, CHUNK_BYTES)
+
+                t0 = time.monotonic()
+                next_print = t0
+                chunk_idx = 0
+                while not self.stop_event.is_set():
+                    if chunk_idx < n_full:
+                        n = min(batch, n_full - chunk_idx)
+                        for k in range(n):
+                            ESP_HDR.pack_into(tx_hdrs[k], 0, self.next_seq(), PKT_AUDIO_UP, 0)
+                            tx_offs[k] = (chunk_idx + k) * CHUNK_BYTES
+                        tx.send(n, tx_offs)
+                        self.bytes_sent += n * CHUNK_BYTES
+                    elif chunk_idx == n_full and tail:
+                        self.sock_tx.sendto(build_packet(self.next_seq(), PKT_AUDIO_UP, 0, tail),
+                                            self.server_addr)
+                        n = 1
+                        self.bytes_sent += len(tail)
+                    else:
+                        break
+                    self.pkts_sent += n
+                    chunk_idx += n
+
+                    # Pace to approximately real-time
+                    target_time = t0 + chunk_idx * chunk_duration
+                    now = time.monotonic()
+                    if now < target_time:
+                        time.sleep(target_time - now)
+
+                    # Progress (4 Hz, not per packet)
+                    if now >= next_print:
+                        next_print = now + 0.25
+                        sys.stdout.write(_WAV_PROGRESS % (chunk_idx, now - t0,
+                                                          self.bytes_sent >> 10,
+                                                          self.bytes_recv >> 10))
+                        sys.stdout.flush()
+
+                self.sent_pcm.append(raw[:self.bytes_sent])
+            finally:
+                # Exported views must go before the mapping can close
+                if tx is not None:
+                    tx.close()
+                tail = None
+                raw.release()
 
         dt = time.monotonic() - t0
         print(f"\n   ✅ WAV send done — {self.pkts_sent} packets, "
@@ -387,19 +661,27 @@ class AudioRoundTripTest:
         print(f"  Audio format: {SAMPLE_RATE} Hz, 16-bit, mono")
         print(f"  Output dir  : {self.output_dir}")
         print(f"  Resp timeout: {self.response_timeout:.0f}s")
+        print(f"  UDP buffers : "
+              f"rcv {self.sock_rx.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 1024} KB, "
+              f"snd {self.sock_tx.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) // 1024} KB")
         print()
 
-        # ── Step 1: Start session ──────────────────────────────────
+        # ── Step 1: Start receiver thread ──────────────────────────
+        # Started before SESSION_START so SERVER_READY/ACK are read by the
+        # same thread as everything else.
+        self.running = True
+        recv_loop = self.receiver_loop_iouring if self.iouring else self.receiver_loop
+        recv_thread = threading.Thread(target=recv_loop, daemon=True, name="recv")
+        recv_thread.start()
+
+        # ── Step 2: Start session ──────────────────────────────────
         print("─── Step 1: Start session ───────────────────────────")
         if not self.session_start():
-            self.sock.close()
+            self.running = False
+            recv_thread.join(timeout=2.0)
+            self.close()
             return
 
-        # ── Step 2: Start receiver thread ──────────────────────────
-        self.running = True
-        recv_thread = threading.Thread(target=self.receiver_loop, daemon=True, name="recv")
-        recv_thread.start()
-
         # ── Step 3: Send audio (mic or WAV) ────────────────────────
         print()
         print("─── Step 2: Send audio ──────────────────────────────")
@@ -449,6 +731,7 @@ class AudioRoundTripTest:
                 f"({self.pkts_recv} packets)"
             )
             sys.stdout.flush()
+            self.drain_recv()
             time.sleep(0.2)
 
         print()
@@ -456,6 +739,10 @@ class AudioRoundTripTest:
         # ── Step 6: Stop receiver ──────────────────────────────────
         self.running = False
         recv_thread.join(timeout=2.0)
+        self.drain_recv()
+        if self.recv_ring.dropped:
+            print(f"   ⚠️  {self.recv_ring.dropped:,} bytes of response audio dropped "
+                  f"(receive ring full)")
 
         # ── Step 7: Save WAV files ─────────────────────────────────
         print()
@@ -465,7 +752,7 @@ class AudioRoundTripTest:
         resp_path = os.path.join(self.output_dir, "openai_response.wav")
 
         if self.sent_pcm:
-            write_wav(sent_path, bytes(self.sent_pcm))
+            write_wav(sent_path, self.sent_pcm.view())
             sent_dur = len(self.sent_pcm) / (SAMPLE_RATE * BYTES_PER_SAMPLE)
             print(f"   💾 Sent audio saved:     {sent_path}")
             print(f"      {len(self.sent_pcm):,} bytes, {sent_dur:.2f}s")
@@ -474,7 +761,7 @@ class AudioRoundTripTest:
             sent_path = None
 
         if self.recv_pcm:
-            write_wav(resp_path, bytes(self.recv_pcm))
+            write_wav(resp_path, self.recv_pcm.view())
             resp_dur = len(self.recv_pcm) / (SAMPLE_RATE * BYTES_PER_SAMPLE)
             print(f"   💾 Response audio saved: {resp_path}")
             print(f"      {len(self.recv_pcm):,} bytes, {resp_dur:.2f}s")
@@ -509,7 +796,7 @@ class AudioRoundTripTest:
             print("   and that OPENAI_API_KEY is set correctly.")
         print()
 
-        self.sock.close()
+        self.close()
 
 
 # ═══════════════════════════════════════════════════════════════════════
@@ -544,31 +831,43 @@ Examples:
     parser.add_argument("--response-timeout", type=float, default=15.0,
                         help="Seconds to wait for OpenAI response after sending "
                              "(default: 15)")
+    parser.add_argument("--send-batch", type=int, default=1,
+                        help="WAV input: chunks per sendmmsg() call, paced as "
+                             "one burst (default: 1)")
+    parser.add_argument("--udp-rcvbuf", type=int, default=4 << 20,
+                        help="UDP SO_RCVBUF in bytes (default: 4 MiB; raise "
+                             "net.core.rmem_max to allow more)")
+    parser.add_argument("--udp-sndbuf", type=int, default=1 << 20,
+                        help="UDP SO_SNDBUF in bytes (default: 1 MiB; raise "
+                             "net.core.wmem_max to allow more)")
+    parser.add_argument("--iouring", action="store_true",
+                        help="Receive via an io_uring multishot recv (Linux, "
+                             "pip install liburing)")
     parser.add_argument("--list-devices", action="store_true",
                         help="List available audio devices and exit")
 
     args = parser.parse_args()
 
     # ── Dependency check ───────────────────────────────────────────
-    if args.wav_input is None:
-        try:
-            import sounddevice as sd
-            import numpy as np
-        except ImportError:
-            print("❌ sounddevice + numpy required for mic capture:")
-            print("   pip install sounddevice numpy")
-            sys.exit(1)
-
-        if args.list_devices:
+    if args.list_devices:
+        if sd is None:
+            print("sounddevice not installed — can't list devices")
+        else:
             print(sd.query_devices())
-            return
-    elif args.list_devices:
+        return
+
+    if args.wav_input is None and (sd is None or np is None):
+        print("❌ sounddevice + numpy required for mic capture:")
+        print("   pip install sounddevice numpy")
+        sys.exit(1)
+
+    if args.iouring:
         try:
-            import sounddevice as sd
-            print(sd.query_devices())
+            import liburing
         except ImportError:
-            print("sounddevice not installed — can't list devices")
-        return
+            print("❌ liburing required for --iouring:")
+            print("   pip install liburing")
+            sys.exit(1)
 
     # ── Validate WAV input ─────────────────────────────────────────
     if args.wav_input and not os.path.isfile(args.wav_input):
@@ -583,6 +882,10 @@ Examples:
         input_device=args.input_device,
         wav_input=args.wav_input,
         response_timeout=args.response_timeout,
+        send_batch=max(1, args.send_batch),
+        udp_rcvbuf=args.udp_rcvbuf,
+        udp_sndbuf=args.udp_sndbuf,
+        iouring=args.iouring,
     )
 
     def on_sigint(sig, frame):
@@ -17,21 +17,34 @@ Saves two WAV files for comparison:
 Usage:
     python3 bench/test_esp_protocol.py [--host 127.0.0.1] [--port 9001]
                                        [--duration 3.0] [--audio-dir /tmp/esp_audio]
+                                       [--sndbuf BYTES] [--rcvbuf BYTES]
+
+Optional: pip install numpy   (vectorized tone generation / WAV diff;
+                               falls back to the array module without it)
 """
 
 import argparse
-import glob
+import array
+import functools
 import math
 import os
+import selectors
 import socket
 import struct
 import sys
 import time
 import wave
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # ── Protocol constants (must mirror esp_audio_protocol.rs) ──────────
 
 ESP_HEADER = 4  # bytes
+ESP_HDR = struct.Struct("<HBB")  # seq: u16, type: u8, flags: u8
+ESP_SEQ = struct.Struct("<H")    # seq field patched into prebuilt packets
 
 PKT_AUDIO_UP   = 0x01
 PKT_AUDIO_DOWN = 0x02
@@ -67,10 +80,21 @@ CTRL_NAMES = {
     CTRL_SERVER_READY:  "SERVER_READY",
 }
 
+# describe() flag text for every combination of the three flag bits
+FLAG_STRS = tuple(
+    "|".join(name for bit, name in ((FLAG_START, "START"), (FLAG_END, "END"),
+                                    (FLAG_URGENT, "URGENT")) if f & bit) or "0"
+    for f in range(8)
+)
+
+IP_TOS_EF = 0xB8  # DSCP 46 (Expedited Forwarding) << 2, as set by real devices
+
+REPLY_TIMEOUT = 3.0  # seconds to wait for each control / heartbeat reply
+
 # ── Packet builders ────────────────────────────────────────────────
 
 def build_packet(seq: int, pkt_type: int, flags: int, payload: bytes = b"") -> bytes:
-    return struct.pack("<HBB", seq, pkt_type, flags) + payload
+    return ESP_HDR.pack(seq, pkt_type, flags) + payload
 
 def build_control(seq: int, cmd: int, flags: int = 0) -> bytes:
     return build_packet(seq, PKT_CONTROL, flags, bytes([cmd]))
@@ -78,11 +102,23 @@ def build_control(seq: int, cmd: int, flags: int = 0) -> bytes:
 def build_heartbeat(seq: int) -> bytes:
     return build_packet(seq, PKT_HEARTBEAT, 0)
 
+# Control/heartbeat packets differ only in seq: build each once and patch
+# the two seq bytes in place before sending (see with_seq).
+HEARTBEAT_PKT     = bytearray(build_heartbeat(0))
+SESSION_START_PKT = bytearray(build_control(0, CTRL_SESSION_START, FLAG_START))
+SESSION_END_PKT   = bytearray(build_control(0, CTRL_SESSION_END, FLAG_END))
+CANCEL_PKT        = bytearray(build_control(0, CTRL_CANCEL))
+
+def with_seq(pkt: bytearray, seq: int) -> bytearray:
+    """Stamp `seq` into a prebuilt packet template and return it."""
+    ESP_SEQ.pack_into(pkt, 0, seq)
+    return pkt
+
 def parse_packet(data: bytes):
     """Return (seq, pkt_type, flags, payload) or None."""
     if len(data) < ESP_HEADER:
         return None
-    seq, pkt_type, flags = struct.unpack("<HBB", data[:ESP_HEADER])
+    seq, pkt_type, flags = ESP_HDR.unpack_from(data)
     payload = data[ESP_HEADER:]
     return seq, pkt_type, flags, payload
 
@@ -92,11 +128,7 @@ def describe(seq, pkt_type, flags, payload):
     if pkt_type == PKT_CONTROL and payload:
         cmd = payload[0]
         extra = f" cmd={CTRL_NAMES.get(cmd, f'0x{cmd:02x}')}"
-    flag_parts = []
-    if flags & FLAG_START: flag_parts.append("START")
-    if flags & FLAG_END:   flag_parts.append("END")
-    if flags & FLAG_URGENT: flag_parts.append("URGENT")
-    flag_str = "|".join(flag_parts) if flag_parts else "0"
+    flag_str = FLAG_STRS[flags & 0x07]
     return f"seq={seq} type={name} flags={flag_str}{extra} payload={len(payload)}B"
 
 # ── Audio generator ────────────────────────────────────────────────
@@ -104,88 +136,155 @@ def describe(seq, pkt_type, flags, payload):
 def gen_sine_chunk(freq: float = 440.0, n_samples: int = 700,
                    sample_rate: int = 16000, amplitude: float = 0.5) -> bytes:
     """Generate one chunk of 16-bit LE PCM sine wave (700 samples = 1400 B = 43.75 ms)."""
-    buf = bytearray(n_samples * 2)
-    for i in range(n_samples):
-        t = i / sample_rate
-        val = int(32767 * amplitude * math.sin(2 * math.pi * freq * t))
-        struct.pack_into("<h", buf, i * 2, val)
-    return bytes(buf)
+    return gen_sine_continuous(freq, n_samples, 0, sample_rate, amplitude)
+
+
+SINE_RESEED = 1024  # samples between exact sin() seeds in the no-numpy fallback
+
+
+def _sine(freq: float, sample_offset: int, n_samples: int,
+          sample_rate: int, amplitude: float):
+    """The tone's samples as little-endian int16 (ndarray, or array('h') without numpy)."""
+    if np is not None:
+        t = (sample_offset + np.arange(n_samples)) / sample_rate
+        # astype truncates toward zero, like int() on the scalar value
+        return (32767 * amplitude * np.sin(2 * np.pi * freq * t)).astype("<i2")
+
+    # sin((n+1)θ) = 2cos(θ)·sin(nθ) − sin((n−1)θ): one multiply-subtract per
+    # sample instead of a libm sin() call, re-seeded every SINE_RESEED
+    # samples so rounding can't accumulate.
+    w = 2 * math.pi * freq
+    c = 2 * math.cos(w / sample_rate)
+    scale = 32767 * amplitude
+    pcm = array.array("h", bytes(2 * n_samples))
+    for base in range(0, n_samples, SINE_RESEED):
+        n0 = sample_offset + base
+        s_prev = math.sin(w * ((n0 - 1) / sample_rate))
+        s_cur = math.sin(w * (n0 / sample_rate))
+        for i in range(base, min(base + SINE_RESEED, n_samples)):
+            pcm[i] = int(scale * s_cur)
+            s_prev, s_cur = s_cur, c * s_cur - s_prev
+    if sys.byteorder == "big":
+        pcm.byteswap()
+    return pcm
+
+
+@functools.lru_cache(maxsize=8)
+def _sine_table(freq: float, sample_rate: int, amplitude: float):
+    """One full period of the tone as int16 (≤ 1 s long), or None for a non-integer freq."""
+    if freq != int(freq):
+        return None
+    period = sample_rate // math.gcd(int(freq), sample_rate)  # 440 Hz @ 16 kHz → 400
+    return _sine(freq, 0, period, sample_rate, amplitude)
 
 
 def gen_sine_continuous(freq: float, n_samples: int, sample_offset: int,
                         sample_rate: int = 16000, amplitude: float = 0.5) -> bytes:
     """Generate a chunk with correct phase continuity across packets."""
-    buf = bytearray(n_samples * 2)
-    for i in range(n_samples):
-        t = (sample_offset + i) / sample_rate
-        val = int(32767 * amplitude * math.sin(2 * math.pi * freq * t))
-        struct.pack_into("<h", buf, i * 2, val)
-    return bytes(buf)
+    table = _sine_table(freq, sample_rate, amplitude)
+    if table is None:
+        return _sine(freq, sample_offset, n_samples, sample_rate, amplitude).tobytes()
+    # Wavetable: the tone repeats every len(table) samples, so a chunk is a
+    # (wrapped) slice of the precomputed period — no sin() per packet.
+    start = sample_offset % len(table)
+    reps = -(-(start + n_samples) // len(table))
+    tiled = np.tile(table, reps) if np is not None else table * reps
+    return tiled[start:start + n_samples].tobytes()
+
+
+WAV_IO_BUFFER = 256 * 1024  # file buffer for WAV reads/writes (fewer syscalls)
 
 
 def write_wav(path: str, pcm_data: bytes,
               sample_rate: int = 16000, channels: int = 1, bits: int = 16):
-    """Write raw PCM bytes to a WAV file."""
-    with wave.open(path, "wb") as wf:
+    """Write raw PCM (any bytes-like object) to a WAV file."""
+    with open(path, "wb", buffering=WAV_IO_BUFFER) as f, wave.open(f, "wb") as wf:
         wf.setnchannels(channels)
         wf.setsampwidth(bits // 8)
         wf.setframerate(sample_rate)
         wf.writeframes(pcm_data)
 
 
+COMPARE_BLOCK_FRAMES = 32768  # frames per block when diffing WAVs (64 KB of 16-bit mono)
+
+
+def _diff_block(blk_a: bytes, blk_b: bytes, n: int):
+    """(max, sum, count) of |a − b| over the first n int16 samples of two blocks."""
+    if np is not None:
+        # widen to int32 before subtracting so int16 differences can't wrap
+        d = np.frombuffer(blk_a, dtype="<i2", count=n).astype(np.int32)
+        np.subtract(d, np.frombuffer(blk_b, dtype="<i2", count=n), out=d)
+        np.abs(d, out=d)
+        return int(d.max()), int(d.sum(dtype=np.int64)), int(np.count_nonzero(d))
+
+    sa = array.array("h", blk_a[:n * 2])
+    sb = array.array("h", blk_b[:n * 2])
+    if sys.byteorder == "big":
+        sa.byteswap()
+        sb.byteswap()
+    d = [abs(x - y) for x, y in zip(sa, sb)]
+    return max(d), sum(d), n - d.count(0)
+
+
 def compare_wav_files(path_a: str, path_b: str, label_a: str = "A",
                       label_b: str = "B"):
-    """Compare two WAV files and print detailed stats."""
-    print(f"\n  ┌─ Comparing: {label_a} vs {label_b}")
+    """Compare two WAV files and print detailed stats.
 
-    with wave.open(path_a, "rb") as wa:
-        rate_a, ch_a, sw_a = wa.getframerate(), wa.getnchannels(), wa.getsampwidth()
-        frames_a = wa.getnframes()
-        data_a = wa.readframes(frames_a)
-
-    with wave.open(path_b, "rb") as wb:
-        rate_b, ch_b, sw_b = wb.getframerate(), wb.getnchannels(), wb.getsampwidth()
-        frames_b = wb.getnframes()
-        data_b = wb.readframes(frames_b)
-
-    print(f"  │  {label_a}: {rate_a}Hz {ch_a}ch {sw_a*8}bit  "
-          f"{frames_a} frames  {len(data_a)} bytes  "
-          f"{frames_a/rate_a:.3f}s")
-    print(f"  │  {label_b}: {rate_b}Hz {ch_b}ch {sw_b*8}bit  "
-          f"{frames_b} frames  {len(data_b)} bytes  "
-          f"{frames_b/rate_b:.3f}s")
-
-    # Format match
-    fmt_match = (rate_a == rate_b and ch_a == ch_b and sw_a == sw_b)
-    print(f"  │  Format match: {'✅' if fmt_match else '❌'}")
-
-    # Byte-level comparison
-    min_len = min(len(data_a), len(data_b))
-    if min_len == 0:
-        print("  │  ⚠️  One file is empty — cannot compare")
-        print("  └─")
-        return False
+    Both files are streamed in COMPARE_BLOCK_FRAMES blocks, so memory use
+    stays constant however long the captures are.
+    """
+    print(f"\n  ┌─ Comparing: {label_a} vs {label_b}")
 
-    byte_match = (data_a[:min_len] == data_b[:min_len])
-    if byte_match and len(data_a) == len(data_b):
+    with open(path_a, "rb", buffering=WAV_IO_BUFFER) as fa, wave.open(fa, "rb") as wa, \
+         open(path_b, "rb", buffering=WAV_IO_BUFFER) as fb, wave.open(fb, "rb") as wb:
+        rate_a, ch_a, sw_a, frames_a = (wa.getframerate(), wa.getnchannels(),
+                                        wa.getsampwidth(), wa.getnframes())
+        rate_b, ch_b, sw_b, frames_b = (wb.getframerate(), wb.getnchannels(),
+                                        wb.getsampwidth(), wb.getnframes())
+        len_a = frames_a * ch_a * sw_a
+        len_b = frames_b * ch_b * sw_b
+
+        print(f"  │  {label_a}: {rate_a}Hz {ch_a}ch {sw_a*8}bit  "
+              f"{frames_a} frames  {len_a} bytes  "
+              f"{frames_a/rate_a:.3f}s")
+        print(f"  │  {label_b}: {rate_b}Hz {ch_b}ch {sw_b*8}bit  "
+              f"{frames_b} frames  {len_b} bytes  "
+              f"{frames_b/rate_b:.3f}s")
+
+        # Format match
+        fmt_match = (rate_a == rate_b and ch_a == ch_b and sw_a == sw_b)
+        print(f"  │  Format match: {'✅' if fmt_match else '❌'}")
+
+        if min(len_a, len_b) == 0:
+            print("  │  ⚠️  One file is empty — cannot compare")
+            print("  └─")
+            return False
+
+        # Sample-level diff stats, one block pair at a time; identical
+        # blocks (the usual case) are settled by a memcmp.
+        n_samples = 0
+        max_diff = 0
+        sum_diff = 0
+        diff_count = 0
+        while True:
+            blk_a = wa.readframes(COMPARE_BLOCK_FRAMES)
+            blk_b = wb.readframes(COMPARE_BLOCK_FRAMES)
+            n = min(len(blk_a), len(blk_b)) // 2
+            if n == 0:
+                break
+            n_samples += n
+            if blk_a == blk_b:
+                continue
+            bmax, bsum, bcount = _diff_block(blk_a, blk_b, n)
+            max_diff = max(max_diff, bmax)
+            sum_diff += bsum
+            diff_count += bcount
+
+    if diff_count == 0 and len_a == len_b:
         print("  │  Byte-exact match: ✅ (identical)")
         print("  └─")
         return True
 
-    # Sample-level diff stats
-    n_samples = min_len // 2
-    max_diff = 0
-    sum_diff = 0
-    diff_count = 0
-    for i in range(n_samples):
-        sa = struct.unpack_from("<h", data_a, i * 2)[0]
-        sb = struct.unpack_from("<h", data_b, i * 2)[0]
-        d = abs(sa - sb)
-        if d > 0:
-            diff_count += 1
-        max_diff = max(max_diff, d)
-        sum_diff += d
-
     avg_diff = sum_diff / n_samples if n_samples else 0
     pct_match = (1.0 - diff_count / n_samples) * 100 if n_samples else 0
 
@@ -195,9 +294,9 @@ def compare_wav_files(path_a: str, path_b: str, label_a: str = "A",
     print(f"  │  Max sample diff:  {max_diff}")
     print(f"  │  Avg sample diff:  {avg_diff:.2f}")
 
-    if len(data_a) != len(data_b):
-        extra = abs(len(data_a) - len(data_b))
-        longer = label_a if len(data_a) > len(data_b) else label_b
+    if len_a != len_b:
+        extra = abs(len_a - len_b)
+        longer = label_a if len_a > len_b else label_b
         print(f"  │  Size mismatch: {longer} has {extra} extra bytes")
 
     ok = (pct_match >= 99.9 and max_diff <= 1)
@@ -206,6 +305,92 @@ def compare_wav_files(path_a: str, path_b: str, label_a: str = "A",
     return ok
 
 
+def server_wavs_since(audio_dir: str, since: float):
+    """Server esp_*.wav files in audio_dir modified after `since` (one scandir pass)."""
+    try:
+        with os.scandir(audio_dir) as it:
+            return [e.path for e in it
+                    if e.name.startswith("esp_") and e.name.endswith(".wav")
+                    and e.stat().st_mtime > since]
+    except FileNotFoundError:
+        return []
+
+
+# ── Socket helpers ─────────────────────────────────────────────────
+#
+# The socket is non-blocking and registered with a selector: replies are
+# awaited with wait_reply(), and anything the server sends while we are
+# streaming is drained during the pacing gaps instead of piling up in
+# the receive buffer.
+
+def drain(sock) -> int:
+    """Discard every datagram already queued on the socket; return the count."""
+    recv = sock.recv
+    n = 0
+    while True:
+        try:
+            recv(1500)
+        except BlockingIOError:
+            return n
+        n += 1
+
+
+def wait_reply(sock, sel, timeout: float = REPLY_TIMEOUT):
+    """recvfrom() on the non-blocking socket, raising socket.timeout after `timeout`s."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return sock.recvfrom(1500)
+        except BlockingIOError:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not sel.select(remaining):
+            raise socket.timeout("timed out")
+
+
+# ── Paced streaming ───────────────────────────────────────────────
+#
+# One small loop per send strategy, picked once by the caller, so the
+# per-packet path has no branches and touches only locals. Both pace
+# against t0 + seq * period, spending the gap to the next packet's
+# deadline in sel.select() so server traffic is drained as it arrives.
+# Each returns the number of datagrams drained.
+
+def stream_gather(sock, sel, server, packets, period, t0):
+    """Send (header, payload) pairs with sendmsg(), paced to real time."""
+    sendmsg, select = sock.sendmsg, sel.select
+    monotonic = time.monotonic
+    drained = 0
+    for seq, iov in enumerate(packets, 1):
+        sendmsg(iov, (), 0, server)
+        deadline = t0 + seq * period
+        delay = deadline - monotonic()
+        while delay > 0.001:
+            if select(delay):
+                drained += drain(sock)
+            delay = deadline - monotonic()
+    return drained
+
+
+def stream_copy(sock, sel, server, packets, period, t0):
+    """Fallback: copy each pair into one reused packet buffer for sendto()."""
+    sendto, select = sock.sendto, sel.select
+    monotonic = time.monotonic
+    pkt_buf = bytearray(ESP_HEADER + len(packets[0][1])) if packets else bytearray()
+    drained = 0
+    for seq, (hdr, payload) in enumerate(packets, 1):
+        pkt_buf[:ESP_HEADER] = hdr
+        pkt_buf[ESP_HEADER:] = payload
+        sendto(pkt_buf, server)
+        deadline = t0 + seq * period
+        delay = deadline - monotonic()
+        while delay > 0.001:
+            if select(delay):
+                drained += drain(sock)
+            delay = deadline - monotonic()
+    return drained
+
+
 # ── Main test ──────────────────────────────────────────────────────
 
 def main():
@@ -216,12 +401,27 @@ def main():
                     help="seconds of audio to stream")
     ap.add_argument("--audio-dir", default="/tmp/esp_audio",
                     help="directory where server saves WAV files")
+    ap.add_argument("--sndbuf", type=int, default=1 << 20,
+                    help="UDP SO_SNDBUF in bytes (default 1 MiB)")
+    ap.add_argument("--rcvbuf", type=int, default=1 << 20,
+                    help="UDP SO_RCVBUF in bytes (default 1 MiB)")
     args = ap.parse_args()
 
     server = (args.host, args.port)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(3.0)
     sock.bind(("0.0.0.0", 0))  # explicit bind for reliable recvfrom
+    # Headroom for faster pacing / longer --duration than the ~208 KB
+    # Linux defaults; the kernel caps these at net.core.{w,r}mem_max.
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, args.sndbuf)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+    # Mark AUDIO_UP as low-latency voice like a real device would (DSCP EF)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, IP_TOS_EF)
+    except OSError:
+        pass
+    sock.setblocking(False)
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
 
     passed = 0
     failed = 0
@@ -237,9 +437,9 @@ def main():
 
     # ── 1. Heartbeat ───────────────────────────────────────────────
     print("\n🔹 Step 1: HEARTBEAT")
-    sock.sendto(build_heartbeat(42), server)
+    sock.sendto(with_seq(HEARTBEAT_PKT, 42), server)
     try:
-        data, _ = sock.recvfrom(1500)
+        data, _ = wait_reply(sock, sel)
         r = parse_packet(data)
         expect("got heartbeat reply", r is not None)
         if r:
@@ -252,12 +452,12 @@ def main():
 
     # ── 2. SESSION_START → SERVER_READY ────────────────────────────
     print("\n🔹 Step 2: SESSION_START → SERVER_READY")
-    # Record existing WAV files so we can detect a new one later
-    existing_wavs = set(glob.glob(os.path.join(args.audio_dir, "esp_*.wav")))
+    # WAVs modified after this point belong to this run
+    t_start = time.time()
 
-    sock.sendto(build_control(0, CTRL_SESSION_START, FLAG_START), server)
+    sock.sendto(with_seq(SESSION_START_PKT, 0), server)
     try:
-        data, _ = sock.recvfrom(1500)
+        data, _ = wait_reply(sock, sel)
         r = parse_packet(data)
         expect("got control reply", r is not None)
         if r:
@@ -273,44 +473,48 @@ def main():
     chunk_bytes = samples_per_chunk * 2
     ms_per_chunk = 43.75
     n_packets = int(args.duration * 1000 / ms_per_chunk)
-    sent_pcm = bytearray()            # accumulate everything we send
+    # The whole tone is generated up front; packets are slices of it, and
+    # it is also exactly what gets saved as test_sent.wav.
+    sent_pcm = gen_sine_continuous(440.0, n_packets * samples_per_chunk, 0)
+    # Headers are packed up front too, so every packet is a ready-made
+    # (header, payload) iovec pair and the paced loop below only sends.
+    flags = 0
+    hdrs = memoryview(b"".join(ESP_HDR.pack(seq, PKT_AUDIO_UP, flags)
+                               for seq in range(1, n_packets + 1)))
+    sent_mv = memoryview(sent_pcm)
+    packets = [(hdrs[i * ESP_HEADER:(i + 1) * ESP_HEADER],
+                sent_mv[i * chunk_bytes:(i + 1) * chunk_bytes])
+               for i in range(n_packets)]
 
     print(f"\n🔹 Step 3: Stream {n_packets} AUDIO_UP packets "
           f"({args.duration:.1f}s, {n_packets * chunk_bytes} bytes)")
 
+    # sendmsg() gathers header + payload slice in the kernel, so the
+    # 1400-byte chunk isn't copied into a fresh packet first (no sendmsg
+    # on Windows — there the pair is copied into one reused packet buffer).
+    stream = stream_gather if getattr(sock, "sendmsg", None) else stream_copy
     t0 = time.monotonic()
-    for seq in range(1, n_packets + 1):
-        sample_offset = (seq - 1) * samples_per_chunk
-        chunk = gen_sine_continuous(440.0, samples_per_chunk, sample_offset)
-        sent_pcm.extend(chunk)
-
-        flags = 0
-        pkt = build_packet(seq, PKT_AUDIO_UP, flags, chunk)
-        sock.sendto(pkt, server)
-
-        # Pace at roughly real-time to avoid flooding
-        elapsed = time.monotonic() - t0
-        target = seq * ms_per_chunk / 1000.0
-        if target > elapsed:
-            time.sleep(target - elapsed)
+    drained = stream(sock, sel, server, packets, ms_per_chunk / 1000.0, t0)
 
     dt = time.monotonic() - t0
     rate = n_packets * chunk_bytes / dt / 1024
     print(f"     sent {n_packets} packets in {dt:.2f}s ({rate:.1f} KB/s)")
+    if drained:
+        print(f"     drained {drained} server packets while streaming")
     expect(f"all {n_packets} packets sent", True)
 
     # Save sent audio as WAV
     os.makedirs(args.audio_dir, exist_ok=True)
     sent_wav_path = os.path.join(args.audio_dir, "test_sent.wav")
-    write_wav(sent_wav_path, bytes(sent_pcm))
+    write_wav(sent_wav_path, sent_pcm)
     print(f"     💾 sent audio saved: {sent_wav_path} "
           f"({len(sent_pcm)} bytes, {len(sent_pcm)/32000:.2f}s)")
 
     # ── 4. SESSION_END → ACK ─────────────────────────────────────
     print("\n🔹 Step 4: SESSION_END → ACK")
-    sock.sendto(build_control(n_packets + 1, CTRL_SESSION_END, FLAG_END), server)
+    sock.sendto(with_seq(SESSION_END_PKT, n_packets + 1), server)
     try:
-        data, _ = sock.recvfrom(1500)
+        data, _ = wait_reply(sock, sel)
         r = parse_packet(data)
         expect("got control reply", r is not None)
         if r:
@@ -324,11 +528,11 @@ def main():
     # ── 5. Verify WAV file saved ─────────────────────────────────
     print("\n🔹 Step 5: Verify WAV saved")
     time.sleep(0.5)  # let the server flush
-    current_wavs = set(glob.glob(os.path.join(args.audio_dir, "esp_*.wav")))
-    new_wavs = current_wavs - existing_wavs
+    new_wavs = server_wavs_since(args.audio_dir, t_start)
     expect("new WAV file created", len(new_wavs) > 0)
-    if new_wavs:
-        wav_path = sorted(new_wavs)[-1]
+    # newest by mtime; picked once here and reused by Step 7
+    wav_path = max(new_wavs, key=os.path.getmtime) if new_wavs else None
+    if wav_path:
         wav_size = os.path.getsize(wav_path)
         expected_audio_bytes = n_packets * chunk_bytes
         expected_wav_size = 44 + expected_audio_bytes  # 44-byte WAV header
@@ -339,18 +543,19 @@ def main():
 
     # ── 6. CANCEL test (bonus) ───────────────────────────────────
     print("\n🔹 Step 6: SESSION_START → stream briefly → CANCEL")
-    cancel_chunk = gen_sine_chunk(440.0)  # single repeated chunk is fine for cancel
-    sock.sendto(build_control(100, CTRL_SESSION_START, FLAG_START), server)
+    # single repeated chunk is fine for cancel; only the seq changes per packet
+    cancel_pkt = bytearray(build_packet(0, PKT_AUDIO_UP, 0, gen_sine_chunk(440.0)))
+    sock.sendto(with_seq(SESSION_START_PKT, 100), server)
     try:
-        data, _ = sock.recvfrom(1500)
+        data, _ = wait_reply(sock, sel)
         r = parse_packet(data)
         if r and r[1] == PKT_CONTROL and r[3] and r[3][0] == CTRL_SERVER_READY:
             # Send a few audio packets then cancel
             for s in range(101, 106):
-                sock.sendto(build_packet(s, PKT_AUDIO_UP, 0, cancel_chunk), server)
+                sock.sendto(with_seq(cancel_pkt, s), server)
                 time.sleep(0.01)
-            sock.sendto(build_control(106, CTRL_CANCEL, 0), server)
-            data2, _ = sock.recvfrom(1500)
+            sock.sendto(with_seq(CANCEL_PKT, 106), server)
+            data2, _ = wait_reply(sock, sel)
             r2 = parse_packet(data2)
             expect("CANCEL → ACK", r2 and r2[1] == PKT_CONTROL and r2[3] and r2[3][0] == CTRL_ACK)
         else:
@@ -360,10 +565,9 @@ def main():
 
     # ── 7. Compare sent WAV vs server-saved WAV ──────────────────
     print("\n🔹 Step 7: Compare SENT audio vs SERVER-saved audio")
-    if new_wavs:
-        server_wav = sorted(new_wavs)[-1]
+    if wav_path:
         match = compare_wav_files(
-            sent_wav_path, server_wav,
+            sent_wav_path, wav_path,
             label_a="SENT (Python)",
             label_b="SERVER (Rust)",
         )
@@ -372,6 +576,7 @@ def main():
         expect("server WAV exists for comparison", False)
 
     # ── Summary ──────────────────────────────────────────────────
+    sel.close()
     sock.close()
     total = passed + failed
     print(f"\n{'='*50}")
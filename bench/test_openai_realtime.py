@@ -17,14 +17,21 @@ Usage:
     # Run with specific input/output devices:
     python test_openai_realtime.py --input-device 2 --output-device 4
 
+    # Pin the socket threads to core 3 at SCHED_FIFO 10 (Linux; root or
+    # CAP_SYS_NICE for the priority):
+    python test_openai_realtime.py --cpu 3 --rt-prio 10
+
 Prerequisites:
-    pip install sounddevice numpy
+    pip install sounddevice
 
     The Rust server must be running with OpenAI Realtime enabled:
     OPENAI_API_KEY=sk-... cargo run -- --openai-realtime
 """
 
 import argparse
+import mmap
+import os
+import selectors
 import socket
 import struct
 import sys
@@ -32,7 +39,9 @@ import threading
 import time
 import queue
 
-import numpy as np
+from audiobuf import ByteRing, wav_data_offset
+from mmsg import UdpBatchReceiver, UdpBatchSender, tune_udp_socket
+from threadtune import check_args, tune_thread
 
 try:
     import sounddevice as sd
@@ -44,6 +53,7 @@ except ImportError:
 # ── ESP Protocol Constants ──────────────────────────────────────────────
 HEADER_SIZE = 4
 MAX_PAYLOAD = 1400
+ESP_HDR = struct.Struct("<HBB")  # seq: u16, type: u8, flags: u8
 PKT_AUDIO_UP = 0x01
 PKT_AUDIO_DOWN = 0x02
 PKT_CONTROL = 0x03
@@ -58,12 +68,26 @@ CTRL_SERVER_READY = 0x07
 
 SAMPLE_RATE = 16000
 CHANNELS = 1
-DTYPE = np.int16
+BLOCKSIZE = int(SAMPLE_RATE * 0.05)  # 50ms audio callback blocks
+MIC_RING_BYTES = 1 << 16             # ~2s of mic audio between callback and sender
+MIC_SEND_PACKETS = 8                 # packets per sendmmsg() on the mic sender
+PLAYBACK_RING_BYTES = 1 << 20        # ~32s of response audio (replies arrive in bursts)
+
+
 
+def build_packet(seq: int, pkt_type: int, flags: int, payload: bytes, buf=None):
+    """Build an ESP packet.
 
-def build_packet(seq: int, pkt_type: int, flags: int, payload: bytes) -> bytes:
-    header = struct.pack("<HBB", seq & 0xFFFF, pkt_type, flags)
-    return header + payload
+    With `buf` (a bytearray of at least HEADER_SIZE + len(payload) bytes)
+    the packet is assembled in place and a memoryview of it is returned,
+    so per-packet hot paths don't allocate.
+    """
+    if buf is None:
+        return ESP_HDR.pack(seq & 0xFFFF, pkt_type, flags) + payload
+    n = HEADER_SIZE + len(payload)
+    ESP_HDR.pack_into(buf, 0, seq & 0xFFFF, pkt_type, flags)
+    buf[HEADER_SIZE:n] = payload
+    return memoryview(buf)[:n]
 
 
 def build_control(seq: int, cmd: int, flags: int = 0) -> bytes:
@@ -71,23 +95,25 @@ def build_control(seq: int, cmd: int, flags: int = 0) -> bytes:
 
 
 def parse_packet(data: bytes):
+    """(seq, type, flags, payload) — payload is a zero-copy memoryview of `data`."""
     if len(data) < HEADER_SIZE:
         return None
-    seq, pkt_type, flags = struct.unpack("<HBB", data[:HEADER_SIZE])
-    payload = data[HEADER_SIZE:]
-    return seq, pkt_type, flags, payload
+    seq, pkt_type, flags = ESP_HDR.unpack_from(data)
+    return seq, pkt_type, flags, memoryview(data)[HEADER_SIZE:]
 
 
 class OpenAiRealtimeTest:
     """Full-duplex ESP audio ↔ OpenAI Realtime test client."""
 
     def __init__(self, host: str, port: int, input_device=None, output_device=None,
-                 wav_input: str = None):
+                 wav_input: str = None, cpu: int = None, rt_prio: int = None):
         self.host = host
         self.port = port
         self.input_device = input_device
         self.output_device = output_device
         self.wav_input = wav_input
+        self.cpu = cpu
+        self.rt_prio = rt_prio
 
         # Validate / resolve audio devices early so we fail fast with a
         # helpful message instead of a cryptic PortAudio -1 error.
@@ -95,14 +121,23 @@ class OpenAiRealtimeTest:
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.settimeout(5.0)
+        # Room for bursts (batched sends, bursty AUDIO_DOWN over WiFi), and DF
+        tune_udp_socket(self.sock)
         self.server_addr = (host, port)
+        # Connected UDP: the destination is resolved once and sends use
+        # send(); the kernel also filters out datagrams from other peers.
+        # A queued ICMP port-unreachable then surfaces as
+        # ConnectionRefusedError, which is ignored like sendto() would.
+        self.sock.connect(self.server_addr)
 
         self.seq_out = 0
         self.running = False
         self.session_active = False
 
-        # Queue for received audio to play back
-        self.playback_queue = queue.Queue(maxsize=500)
+        # Received audio waiting to be played: filled by the receiver
+        # thread, drained by the output callback, no lock either side
+        self.playback_ring = ByteRing(PLAYBACK_RING_BYTES)
+        self._silence = bytes(BLOCKSIZE * 2)
 
         # Stats
         self.packets_sent = 0
@@ -110,6 +145,12 @@ class OpenAiRealtimeTest:
         self.audio_bytes_sent = 0
         self.audio_bytes_recv = 0
 
+        # The mic callback only copies raw int16 into this ring; the mic
+        # sender thread packetizes and sends, so the PortAudio thread never
+        # touches the socket.
+        self.mic_ring = ByteRing(MIC_RING_BYTES)
+        self._mic_wake = queue.SimpleQueue()
+
     def _resolve_devices(self):
         """Validate audio devices, falling back to first available if defaults fail."""
         devices = sd.query_devices()
@@ -118,7 +159,7 @@ class OpenAiRealtimeTest:
         if self.wav_input is None and self.input_device is None:
             try:
                 sd.check_input_settings(device=None, samplerate=SAMPLE_RATE,
-                                        channels=CHANNELS, dtype="float32")
+                                        channels=CHANNELS, dtype="int16")
             except Exception:
                 # Default device doesn't work — pick the first input device
                 for i, d in enumerate(devices):
@@ -137,7 +178,7 @@ class OpenAiRealtimeTest:
         if self.output_device is None:
             try:
                 sd.check_output_settings(device=None, samplerate=SAMPLE_RATE,
-                                         channels=CHANNELS, dtype="float32")
+                                         channels=CHANNELS, dtype="int16")
             except Exception:
                 # Default device doesn't work — pick the first output device
                 for i, d in enumerate(devices):
@@ -151,6 +192,32 @@ class OpenAiRealtimeTest:
                     print(sd.query_devices())
                     sys.exit(1)
 
+    def _make_batch(self, block_frames: int):
+        """Packet buffers + batch sender for one block of `block_frames` samples.
+
+        Each sending thread (mic callback / WAV sender) gets its own batch,
+        since the buffers are filled in place.
+        """
+        n = -(-block_frames * 2 // MAX_PAYLOAD)  # packets per block
+        bufs = [bytearray(HEADER_SIZE + MAX_PAYLOAD) for _ in range(n)]
+        return bufs, [0] * n, UdpBatchSender(self.sock, None, bufs)
+
+    def _send_pcm(self, pcm, batch):
+        """Split a block of PCM into ESP packets and send them in one batch."""
+        bufs, lengths, sender = batch
+        n = 0
+        for offset in range(0, len(pcm), MAX_PAYLOAD):
+            chunk = pcm[offset:offset + MAX_PAYLOAD]
+            build_packet(self.next_seq(), PKT_AUDIO_UP, 0, chunk, buf=bufs[n])
+            lengths[n] = HEADER_SIZE + len(chunk)
+            n += 1
+        try:
+            sender.send(n, lengths)
+            self.packets_sent += n
+            self.audio_bytes_sent += len(pcm)
+        except Exception as e:
+            print(f"⚠️ Send error: {e}", file=sys.stderr)
+
     def next_seq(self) -> int:
         s = self.seq_out
         self.seq_out = (self.seq_out + 1) & 0xFFFF
@@ -158,12 +225,12 @@ class OpenAiRealtimeTest:
 
     def send_session_start(self):
         pkt = build_control(self.next_seq(), CTRL_SESSION_START)
-        self.sock.sendto(pkt, self.server_addr)
+        self.sock.send(pkt)
         print("📞 SESSION_START sent, waiting for SERVER_READY...")
 
         # Wait for SERVER_READY
         try:
-            data, _ = self.sock.recvfrom(2048)
+            data = self.sock.recv(2048)
             parsed = parse_packet(data)
             if parsed:
                 seq, pkt_type, flags, payload = parsed
@@ -174,109 +241,134 @@ class OpenAiRealtimeTest:
         except socket.timeout:
             print("❌ Timeout waiting for SERVER_READY")
             return False
+        except ConnectionRefusedError:
+            print(f"❌ Nothing listening on {self.host}:{self.port}")
+            return False
 
         print("❌ Unexpected response")
         return False
 
     def send_session_end(self):
         pkt = build_control(self.next_seq(), CTRL_SESSION_END)
-        self.sock.sendto(pkt, self.server_addr)
+        try:
+            self.sock.send(pkt)
+        except ConnectionRefusedError:
+            pass
         print("📴 SESSION_END sent")
         self.session_active = False
 
     def mic_callback(self, indata, frames, time_info, status):
-        """Called by sounddevice for each mic chunk."""
+        """Called by sounddevice for each raw int16 mic block: queue it for the sender."""
         if status:
             print(f"⚠️ Mic status: {status}", file=sys.stderr)
 
         if not self.running or not self.session_active:
             return
 
-        # Convert float32 → int16
-        pcm = (indata[:, 0] * 32767).astype(np.int16).tobytes()
-
-        # Split into ESP-sized chunks
-        for offset in range(0, len(pcm), MAX_PAYLOAD):
-            chunk = pcm[offset:offset + MAX_PAYLOAD]
-            pkt = build_packet(self.next_seq(), PKT_AUDIO_UP, 0, chunk)
-            try:
-                self.sock.sendto(pkt, self.server_addr)
-                self.packets_sent += 1
-                self.audio_bytes_sent += len(chunk)
-            except Exception as e:
-                print(f"⚠️ Send error: {e}", file=sys.stderr)
+        self.mic_ring.push(indata)
+        self._mic_wake.put(frames)
 
-    def receiver_thread(self):
-        """Receives AUDIO_DOWN packets and queues them for playback."""
-        self.sock.settimeout(0.5)
+    def mic_sender_thread(self):
+        """Drains the mic ring into ESP packets, up to MIC_SEND_PACKETS per sendmmsg()."""
+        tune_thread(self.cpu, self.rt_prio, "mic sender")
+        batch = self._make_batch(MIC_SEND_PACKETS * MAX_PAYLOAD // 2)
+        scratch = bytearray(MIC_SEND_PACKETS * MAX_PAYLOAD)
+        view = memoryview(scratch)
 
         while self.running:
             try:
-                data, _ = self.sock.recvfrom(2048)
-            except socket.timeout:
+                self._mic_wake.get(timeout=0.5)
+            except queue.Empty:
                 continue
-            except Exception as e:
-                if self.running:
-                    print(f"⚠️ Recv error: {e}", file=sys.stderr)
-                break
+            while True:
+                n = self.mic_ring.pop_into(view)
+                if not n:
+                    break
+                self._send_pcm(view[:n], batch)
 
-            parsed = parse_packet(data)
-            if not parsed:
-                continue
+    def receiver_thread(self):
+        """Receives AUDIO_DOWN packets and queues them for playback.
+
+        Waits on a selector (re-checking `running` every 0.5s) and drains
+        every queued datagram per wake-up from the non-blocking socket, up
+        to 32 per recvmmsg() call (one recvfrom_into() where unavailable).
+        """
+        tune_thread(self.cpu, self.rt_prio, "receiver")
+        self.sock.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
+        recv = UdpBatchReceiver(self.sock, batch=32).recv
+        push = self.playback_ring.push
 
-            seq, pkt_type, flags, payload = parsed
+        try:
+            while self.running:
+                if not sel.select(timeout=0.5):
+                    continue
+                while True:
+                    try:
+                        batch = recv()
+                    except BlockingIOError:
+                        break
+                    except ConnectionRefusedError:
+                        continue
+                    except Exception as e:
+                        if self.running:
+                            print(f"⚠️ Recv error: {e}", file=sys.stderr)
+                        return
+                    # Each datagram is a view into a buffer the kernel wrote
+                    # in place and recv() reuses. AUDIO_DOWN, the bulk of the
+                    # traffic, is recognised by its type byte and its payload
+                    # copied straight into the playback ring: the one copy
+                    # on the RX path. Everything else goes to _handle_packet.
+                    for data, _ in batch:
+                        if len(data) > HEADER_SIZE and data[2] == PKT_AUDIO_DOWN:
+                            self.packets_recv += 1
+                            self.audio_bytes_recv += len(data) - HEADER_SIZE
+                            push(data[HEADER_SIZE:])  # dropped if playback can't keep up
+                        else:
+                            self._handle_packet(data)
+        finally:
+            sel.close()
 
-            if pkt_type == PKT_AUDIO_DOWN and payload:
-                self.packets_recv += 1
-                self.audio_bytes_recv += len(payload)
+    def _handle_packet(self, data):
+        """Dispatch one control / heartbeat packet (AUDIO_DOWN is handled inline)."""
+        parsed = parse_packet(data)
+        if not parsed:
+            return
 
-                # Convert int16 bytes → float32 for playback
-                samples = np.frombuffer(payload, dtype=np.int16).astype(np.float32) / 32768.0
-                try:
-                    self.playback_queue.put_nowait(samples)
-                except queue.Full:
-                    pass  # drop if playback can't keep up
-
-            elif pkt_type == PKT_CONTROL and len(payload) > 0:
-                cmd = payload[0]
-                if cmd == CTRL_STREAM_END:
-                    print("🔊 AI response audio complete")
-                elif cmd == CTRL_ACK:
-                    print("✅ ACK received")
-
-            elif pkt_type == PKT_HEARTBEAT:
-                # Mirror heartbeat back
-                reply = build_packet(seq, PKT_HEARTBEAT, 0, b"")
-                self.sock.sendto(reply, self.server_addr)
+        seq, pkt_type, flags, payload = parsed
+
+        if pkt_type == PKT_CONTROL and len(payload) > 0:
+            cmd = payload[0]
+            if cmd == CTRL_STREAM_END:
+                print("🔊 AI response audio complete")
+            elif cmd == CTRL_ACK:
+                print("✅ ACK received")
+
+        elif pkt_type == PKT_HEARTBEAT:
+            # Mirror heartbeat back
+            reply = build_packet(seq, PKT_HEARTBEAT, 0, b"")
+            try:
+                self.sock.send(reply)
+            except ConnectionRefusedError:
+                pass
 
     def playback_callback(self, outdata, frames, time_info, status):
-        """Called by sounddevice to fill the output buffer."""
+        """Called by sounddevice to fill the raw int16 output buffer."""
         if status:
             print(f"⚠️ Output status: {status}", file=sys.stderr)
 
-        filled = 0
-        while filled < frames:
-            try:
-                chunk = self.playback_queue.get_nowait()
-                n = min(len(chunk), frames - filled)
-                outdata[filled:filled + n, 0] = chunk[:n]
-                filled += n
-                # If chunk had more data than we needed, put remainder back
-                if n < len(chunk):
-                    try:
-                        self.playback_queue.put_nowait(chunk[n:])
-                    except queue.Full:
-                        pass
-            except queue.Empty:
-                break
+        out = memoryview(outdata).cast("B")
+        filled = self.playback_ring.pop_into(out)
 
         # Fill remainder with silence
-        if filled < frames:
-            outdata[filled:, 0] = 0.0
+        if filled < len(out):
+            out[filled:] = self._silence[:len(out) - filled]
 
     def _send_wav_file(self):
         """Read a WAV file and send it as ESP audio packets."""
         import wave
+        tune_thread(self.cpu, self.rt_prio, "WAV sender")
         with wave.open(self.wav_input, "rb") as wf:
             assert wf.getnchannels() == 1, f"WAV must be mono, got {wf.getnchannels()} channels"
             assert wf.getsampwidth() == 2, f"WAV must be 16-bit, got {wf.getsampwidth() * 8}-bit"
@@ -287,21 +379,31 @@ class OpenAiRealtimeTest:
             audio_secs = n_frames / rate
             print(f"📁 Sending WAV: {self.wav_input} ({audio_secs:.1f}s, {rate} Hz)")
 
-            chunk_samples = int(rate * 0.05)  # 50ms chunks
-            while self.running:
-                pcm = wf.readframes(chunk_samples)
-                if not pcm:
-                    break
-                for offset in range(0, len(pcm), MAX_PAYLOAD):
-                    chunk = pcm[offset:offset + MAX_PAYLOAD]
-                    pkt = build_packet(self.next_seq(), PKT_AUDIO_UP, 0, chunk)
-                    try:
-                        self.sock.sendto(pkt, self.server_addr)
-                        self.packets_sent += 1
-                        self.audio_bytes_sent += len(chunk)
-                    except Exception as e:
-                        print(f"⚠️ Send error: {e}", file=sys.stderr)
-                time.sleep(0.05)  # pace to ~real-time
+        chunk_samples = int(rate * 0.05)  # 50ms chunks
+        chunk_bytes = chunk_samples * 2
+        batch = self._make_batch(chunk_samples)
+        # Pace to real time against absolute deadlines, so the time
+        # spent reading and sending doesn't add up over a long file.
+        period = chunk_samples / rate
+
+        # Map the file instead of readframes(): the header was validated
+        # above, so each block is a zero-copy slice of the page cache.
+        with open(self.wav_input, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data_off = wav_data_offset(mm)
+            raw = memoryview(mm)[data_off:data_off + n_frames * 2]
+            try:
+                next_send = time.monotonic()
+                for off in range(0, len(raw), chunk_bytes):
+                    if not self.running:
+                        break
+                    self._send_pcm(raw[off:off + chunk_bytes], batch)
+                    next_send += period
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            finally:
+                raw.release()  # the map can't close while a view is exported
         print("📁 WAV file fully sent")
 
     def run(self, duration: float = 30.0):
@@ -312,6 +414,9 @@ class OpenAiRealtimeTest:
         print(f"   Audio:  {SAMPLE_RATE} Hz, 16-bit, mono")
         print(f"   Input:  {input_label}")
         print(f"   Output: device {self.output_device or 'default'}")
+        print(f"   Socket: SO_SNDBUF="
+              f"{self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) // 1024} KB, "
+              f"SO_RCVBUF={self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 1024} KB")
         print()
 
         # Start session
@@ -325,7 +430,8 @@ class OpenAiRealtimeTest:
         recv_thread.start()
 
         # Start audio streams
-        blocksize = int(SAMPLE_RATE * 0.05)  # 50ms chunks
+        blocksize = BLOCKSIZE
+        mic_thread = None
 
         try:
             if self.wav_input:
@@ -336,10 +442,10 @@ class OpenAiRealtimeTest:
                 # Try to open output stream for playback, but don't fail if unavailable
                 out_stream = None
                 try:
-                    out_stream = sd.OutputStream(
+                    out_stream = sd.RawOutputStream(
                         samplerate=SAMPLE_RATE,
                         channels=CHANNELS,
-                        dtype="float32",
+                        dtype="int16",
                         blocksize=blocksize,
                         device=self.output_device,
                         callback=self.playback_callback,
@@ -366,18 +472,20 @@ class OpenAiRealtimeTest:
                     out_stream.stop()
                     out_stream.close()
             else:
-                # Live mic mode
-                with sd.InputStream(
+                # Live mic mode: raw int16 capture, sent from its own thread
+                mic_thread = threading.Thread(target=self.mic_sender_thread, daemon=True)
+                mic_thread.start()
+                with sd.RawInputStream(
                     samplerate=SAMPLE_RATE,
                     channels=CHANNELS,
-                    dtype="float32",
+                    dtype="int16",
                     blocksize=blocksize,
                     device=self.input_device,
                     callback=self.mic_callback,
-                ), sd.OutputStream(
+                ), sd.RawOutputStream(
                     samplerate=SAMPLE_RATE,
                     channels=CHANNELS,
-                    dtype="float32",
+                    dtype="int16",
                     blocksize=blocksize,
                     device=self.output_device,
                     callback=self.playback_callback,
@@ -404,6 +512,8 @@ class OpenAiRealtimeTest:
             print("\n⏹️  Interrupted by user")
         finally:
             self.running = False
+            if mic_thread:
+                mic_thread.join(timeout=1.0)  # no AUDIO_UP after SESSION_END
             self.send_session_end()
             time.sleep(0.5)  # Let final packets arrive
             recv_thread.join(timeout=2.0)
@@ -416,6 +526,12 @@ class OpenAiRealtimeTest:
               f"({self.packets_recv} packets)")
         print(f"   Audio sent:     {self.audio_bytes_sent / (SAMPLE_RATE * 2):.1f}s")
         print(f"   Audio received: {self.audio_bytes_recv / (SAMPLE_RATE * 2):.1f}s")
+        if self.playback_ring.dropped:
+            print(f"   ⚠️  Response audio dropped (playback fell behind): "
+                  f"{self.playback_ring.dropped / (SAMPLE_RATE * 2):.1f}s")
+        if self.mic_ring.dropped:
+            print(f"   ⚠️  Mic audio dropped (sender fell behind): "
+                  f"{self.mic_ring.dropped / (SAMPLE_RATE * 2):.1f}s")
 
 
 def main():
@@ -430,8 +546,14 @@ def main():
     parser.add_argument("--output-device", type=int, default=None, help="Output device index")
     parser.add_argument("--wav-input", type=str, default=None,
                         help="Send a WAV file instead of live mic (16kHz 16-bit mono)")
+    parser.add_argument("--cpu", type=int, default=None,
+                        help="Pin the socket sender/receiver threads to this CPU core (Linux only)")
+    parser.add_argument("--rt-prio", type=int, default=None,
+                        help="Run the socket threads SCHED_FIFO at this priority, 1-99 "
+                             "(Linux; needs root or CAP_SYS_NICE)")
 
     args = parser.parse_args()
+    check_args(parser, args.cpu, args.rt_prio)
 
     if args.list_devices:
         print(sd.query_devices())
@@ -443,6 +565,8 @@ def main():
         input_device=args.input_device,
         output_device=args.output_device,
         wav_input=args.wav_input,
+        cpu=args.cpu,
+        rt_prio=args.rt_prio,
     )
     test.run(duration=args.duration)
 
@@ -37,26 +37,45 @@ import socket
 import struct
 import time
 
+from mmsg import UdpBatchSender, tune_udp_socket
+
 # ── Wire format (matches sensor_header_t) ───────────────────────────
 HEADER_FMT = "<IQBxxxHxxQ4x"
-HEADER_SIZE = struct.calcsize(HEADER_FMT)  # 32
+HEADER = struct.Struct(HEADER_FMT)
+HEADER_SIZE = HEADER.size  # 32
 DATA_TYPE_SENSOR_VECTOR = 2
 
+# Per-packet fields, patched into a prebuilt header
+U64 = struct.Struct("<Q")
+TIMESTAMP_OFFSET = struct.calcsize("<I")         # 4
+SEQ_OFFSET = struct.calcsize("<IQBxxxHxx")       # 20
+
+# Below this packet interval, sleeping per packet is too coarse: packets
+# go out in bursts of ~BURST_SECS worth, one sendmmsg() per burst.
+BURST_SECS = 0.002
+
+SENSOR_KEYS = [
+    "battery_low", "people_count", "known_face", "unknown_face",
+    "fall_event", "lifted", "idle_time", "sound_energy",
+    "voice_rate", "motion_energy",
+]
+
 
-def build_packet(sensor_id: int, seq: int, data_type: int, payload: bytes) -> bytes:
+def build_packet(sensor_id: int, seq: int, data_type: int, payload: bytes,
+                 buf: bytearray = None):
+    """Build a sensor packet, in place into `buf` (returning a view of it) if given."""
     timestamp_us = int(time.time() * 1_000_000)
-    header = struct.pack(HEADER_FMT, sensor_id, timestamp_us, data_type, len(payload), seq)
-    return header + payload
+    if buf is None:
+        return HEADER.pack(sensor_id, timestamp_us, data_type, len(payload), seq) + payload
+    n = HEADER_SIZE + len(payload)
+    HEADER.pack_into(buf, 0, sensor_id, timestamp_us, data_type, len(payload), seq)
+    buf[HEADER_SIZE:n] = payload
+    return memoryview(buf)[:n]
 
 
 def make_sensor_vector(**kw) -> bytes:
     """Pack 10 f32 LE values into a 40-byte sensor vector payload."""
-    keys = [
-        "battery_low", "people_count", "known_face", "unknown_face",
-        "fall_event", "lifted", "idle_time", "sound_energy",
-        "voice_rate", "motion_energy",
-    ]
-    vals = [float(kw.get(k, 0.0)) for k in keys]
+    vals = [float(kw.get(k, 0.0)) for k in SENSOR_KEYS]
     return struct.pack("<10f", *vals)
 
 
@@ -150,6 +169,9 @@ MOOD_PRESETS = {
     ),
 }
 
+# Payloads never change per mood, so pack them once
+MOOD_PAYLOADS = {name: make_sensor_vector(**kw) for name, kw in MOOD_PRESETS.items()}
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -171,10 +193,16 @@ def main():
     args = parser.parse_args()
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tune_udp_socket(sock)  # big buffers + DF, no fragmenting
     target = (args.host, args.sensor_port)
+    sock.connect(target)  # resolve the destination once
     interval = 1.0 / args.rate if args.rate > 0 else 0
     seq = 0
 
+    burst = max(1, round(BURST_SECS / interval)) if 0 < interval < BURST_SECS else 1
+    bufs = [bytearray(HEADER_SIZE + 4 * len(SENSOR_KEYS)) for _ in range(burst)]  # 10 × f32
+    sender = UdpBatchSender(sock, None, bufs)  # ignores ECONNREFUSED like sendto()
+
     print(f"🎯 Target: {args.host}:{args.sensor_port}")
     print(f"📋 Moods:  {', '.join(args.moods)}")
     print(f"⏱  Dwell:  {args.dwell}s per mood, {args.rate} pps")
@@ -188,19 +216,34 @@ def main():
                 print(f"  ⚠️  Unknown mood '{mood}', skipping")
                 continue
 
-            payload = make_sensor_vector(**MOOD_PRESETS[mood])
+            payload = MOOD_PAYLOADS[mood]
             pkts_per_dwell = max(1, int(args.dwell * args.rate))
 
             # Show expected V/A/D for reference
             vals = struct.unpack("<10f", payload)
             print(f"  🎭 {mood.upper():12s}  → sending {pkts_per_dwell} packets ...")
 
-            for i in range(pkts_per_dwell):
-                pkt = build_packet(args.sensor_id, seq, DATA_TYPE_SENSOR_VECTOR, payload)
-                sock.sendto(pkt, target)
-                seq += 1
-                if i < pkts_per_dwell - 1 and interval > 0:
-                    time.sleep(interval)
+            # Header + payload templates; only timestamp and seq change per packet
+            for buf in bufs:
+                build_packet(args.sensor_id, seq, DATA_TYPE_SENSOR_VECTOR, payload, buf=buf)
+
+            # Packet i is due at base + i·interval: sleep only up to the
+            # next deadline, so sleep overshoot doesn't accumulate.
+            base = time.perf_counter()
+            i = 0
+            while i < pkts_per_dwell:
+                n = min(burst, pkts_per_dwell - i)
+                timestamp_us = int(time.time() * 1_000_000)  # one clock read per burst
+                for buf in bufs[:n]:
+                    U64.pack_into(buf, TIMESTAMP_OFFSET, timestamp_us)
+                    U64.pack_into(buf, SEQ_OFFSET, seq)
+                    seq += 1
+                sender.send(n)
+                i += n
+                if i < pkts_per_dwell and interval > 0:
+                    slack = base + i * interval - time.perf_counter()
+                    if slack > 0:
+                        time.sleep(slack)
 
             # Small gap between moods
             time.sleep(0.5)
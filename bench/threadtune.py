@@ -0,0 +1,104 @@
+"""
+threadtune.py — CPU pinning and SCHED_FIFO for bench sender/receiver threads.
+
+Both knobs act on the calling thread only, so call them from inside the
+thread being tuned. They are Linux-only; elsewhere a warning is printed
+and the thread runs untuned. Validate the CLI values up front with
+check_args() (or cpu_from_env() for env-var knobs) so a bad core or
+priority is a usage error rather than a thread dying at startup.
+
+Usage:
+    parser.add_argument("--cpu", type=int, default=None)
+    parser.add_argument("--rt-prio", type=int, default=None)
+    args = parser.parse_args()
+    check_args(parser, args.cpu, args.rt_prio)
+    ...
+    tune_thread(args.cpu, args.rt_prio, "receiver")   # in the thread
+"""
+
+import os
+
+# SCHED_FIFO priority range (Linux: 1–99)
+if hasattr(os, "sched_get_priority_min"):
+    RT_PRIO_MIN = os.sched_get_priority_min(os.SCHED_FIFO)
+    RT_PRIO_MAX = os.sched_get_priority_max(os.SCHED_FIFO)
+else:
+    RT_PRIO_MIN, RT_PRIO_MAX = 1, 99
+
+
+def _cpu_error(cpu):
+    """Why `cpu` can't be pinned to, or None if it can (or can't be checked)."""
+    if cpu is None or not hasattr(os, "sched_getaffinity"):
+        return None
+    available = os.sched_getaffinity(0)
+    if cpu not in available:
+        return f"{cpu} is not an available core (available: {sorted(available)})"
+    return None
+
+
+def check_args(parser, cpu, rt_prio, cpu_flag="--cpu", prio_flag="--rt-prio"):
+    """parser.error() out on a core we can't run on or an out-of-range priority."""
+    err = _cpu_error(cpu)
+    if err:
+        parser.error(f"{cpu_flag} {err}")
+    if rt_prio is not None and not RT_PRIO_MIN <= rt_prio <= RT_PRIO_MAX:
+        parser.error(f"{prio_flag} must be {RT_PRIO_MIN}-{RT_PRIO_MAX} (got {rt_prio})")
+
+
+def cpu_from_env(name):
+    """Core number from environment variable `name` (None if unset); exits on a bad value."""
+    value = os.environ.get(name)
+    if value is None:
+        return None
+    try:
+        cpu = int(value)
+    except ValueError:
+        raise SystemExit(f"{name}={value!r} is not a CPU core number")
+    err = _cpu_error(cpu)
+    if err:
+        raise SystemExit(f"{name}: {err}")
+    return cpu
+
+
+def pin_to_cpu(cpu, who="sender"):
+    """Pin the calling thread to one core (Linux only; no-op when cpu is None)."""
+    if cpu is None:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        print(f"⚠️  CPU pinning not supported on this platform — ignoring cpu={cpu}")
+        return
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except OSError as e:
+        print(f"⚠️  {who}: can't pin to CPU {cpu} ({e.strerror}) — leaving unpinned")
+        return
+    print(f"   pinned {who} to CPU {cpu}")
+
+
+def set_rt_priority(prio, who="sender"):
+    """Run the calling thread under SCHED_FIFO at `prio` (Linux; no-op when prio is None).
+
+    Needs root or CAP_SYS_NICE; without it (or for an out-of-range
+    priority) a warning is printed and the thread keeps its normal priority.
+    """
+    if prio is None:
+        return
+    if not hasattr(os, "sched_setscheduler"):
+        print(f"⚠️  Realtime scheduling not supported on this platform — ignoring rt-prio={prio}")
+        return
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(prio))
+    except PermissionError:
+        print(f"⚠️  {who}: SCHED_FIFO needs root or CAP_SYS_NICE — keeping normal priority")
+        return
+    except OSError as e:
+        print(f"⚠️  {who}: can't set SCHED_FIFO priority {prio} ({e.strerror}) — "
+              f"keeping normal priority")
+        return
+    print(f"   {who} running SCHED_FIFO priority {prio}")
+
+
+def tune_thread(cpu, rt_prio, who):
+    """pin_to_cpu() + set_rt_priority() for the calling thread."""
+    pin_to_cpu(cpu, who)
+    set_rt_priority(rt_prio, who)